@@ -33,18 +33,6 @@ meta = [
 servers = [
     {
         "id": "248266453606863597",
-        "log": [
-            {
-                "event": "join",
-                "time": datetime(2005, 12, 27, 23, 59, 59, 123456)
-            },
-            {
-                "event": "update_prefix",
-                "old": ">",
-                "new": "!",
-                "by": "184012255391262369"
-            }
-        ],
         "enabled": True,
         "member": True,
         "joinable": True,
@@ -124,6 +112,23 @@ users = [
     }
 ]
 
+audit = [
+    {
+        "server": "248266453606863597",
+        "event": "join",
+        "time": datetime(2005, 12, 27, 23, 59, 59, 123456)
+    },
+    {
+        "server": "248266453606863597",
+        "event": "update_prefix",
+        "old": ">",
+        "new": "!",
+        "by": "184012255391262369",
+        "reason": None,
+        "time": datetime(2005, 12, 28, 0, 4, 12, 654321)
+    }
+]
+
 plugin_message_filter = [
     {
         "owner": "248266453606863597",
@@ -31,6 +31,12 @@ def main():
     parser.add_argument("-d", "--db", type=str, metavar="DATABASE", dest="DB_NAME", help="name of the database", action="store", default="TransportLayerBot", required=False)
     parser.add_argument("-l", "--log", type=str, metavar="LEVEL", dest="LOG_LEVEL", help="log level", action="store", default="INFO", required=False)
     parser.add_argument("-o", "--output", type=str, metavar="FILE", dest="LOG_FILE", help="log file", action="store", default="TransportLayerBot.log", required=False)
+    parser.add_argument("-q", "--queue-size", type=int, metavar="SIZE", dest="QUEUE_SIZE", help="queue events per server, holding at most SIZE each (0 handles events inline)", action="store", default=0, required=False)
+    parser.add_argument("-w", "--workers", type=int, metavar="WORKERS", dest="WORKERS", help="number of workers draining the server queues", action="store", default=4, required=False)
+    parser.add_argument("--queue-hold", type=float, metavar="SECONDS", dest="QUEUE_HOLD", help="seconds a queued event may hold a worker before running detached", action="store", default=5, required=False)
+    parser.add_argument("--threads", type=int, metavar="THREADS", dest="THREADS", help="size of the thread pool for offloaded plugin functions", action="store", default=4, required=False)
+    parser.add_argument("--processes", type=int, metavar="PROCESSES", dest="PROCESSES", help="size of the process pool for offloaded plugin functions", action="store", default=2, required=False)
+    parser.add_argument("--executor-queue", type=int, metavar="SIZE", dest="EXECUTOR_QUEUE", help="most offloaded calls waiting on each pool", action="store", default=100, required=False)
     parser.add_argument("-i", "--interface", dest="USE_INTERFACE", help="use the experimental interface", action="store_true")
     SETTINGS = vars(parser.parse_args())
 
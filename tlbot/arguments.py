@@ -0,0 +1,89 @@
+###############################################################################
+#   TransportLayerBot: Arguments - All-in-one modular bot for Discord         #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+import re
+from tlbot import lang
+from tlbot import templates
+
+TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+WHITESPACE = re.compile(r"\s*")
+ESCAPE = re.compile(r"\\(.)")
+USER = re.compile(r"<@!?(\d+)>|(\d+)")
+CHANNEL = re.compile(r"<#(\d+)>|(\d+)")
+ROLE = re.compile(r"<@&(\d+)>|(\d+)")
+REQUIRED = object()
+
+def _mention(pattern):
+    def _convert(token):
+        match = pattern.fullmatch(token)
+        if not match:
+            raise ValueError(token)
+        return match.group(1) or match.group(2)
+    return _convert
+
+CONVERTERS = {
+    "str": str,
+    "text": str,
+    "int": int,
+    "float": float,
+    "user": _mention(USER),
+    "member": _mention(USER),
+    "channel": _mention(CHANNEL),
+    "role": _mention(ROLE)
+}
+
+class Parser:
+    def __init__(self, arguments):
+        self.arguments = []
+        usage = []
+        for argument in arguments:
+            if not argument.get("name"):
+                raise ValueError(f"Argument {argument} has no name")
+            if not argument.get("type", "str") in CONVERTERS:
+                raise ValueError(f"Unknown argument type {argument['type']}")
+            default = argument.get("default", REQUIRED)
+            self.arguments.append((argument["name"], CONVERTERS[argument.get("type", "str")], default, argument.get("type") == "text"))
+            usage.append(f"<{argument['name']}>" if default is REQUIRED else f"[{argument['name']}]")
+        self.usage = " ".join(usage)
+
+    def parse(self, raw):
+        values = {}
+        position = WHITESPACE.match(raw).end()
+        for name, convert, default, rest in self.arguments:
+            if position >= len(raw):
+                if default is REQUIRED:
+                    return False, lang.ARG_MISSING.format(name=name)
+                values[name] = default
+                continue
+            if rest:
+                values[name] = raw[position:].rstrip()
+                position = len(raw)
+                continue
+            match = TOKEN.match(raw, position)
+            if match.group(1) is not None:
+                token = ESCAPE.sub(r"\1", match.group(1))
+            else:
+                token = match.group(2)
+            position = WHITESPACE.match(raw, match.end()).end()
+            try:
+                values[name] = convert(token)
+            except ValueError:
+                return False, lang.ARG_INVALID.format(name=name, value=templates.escape_mentions(token))
+        if position < len(raw):
+            return False, lang.ARG_TOO_MANY
+        return True, values
@@ -0,0 +1,62 @@
+###############################################################################
+#   TransportLayerBot: Cache - All-in-one modular bot for Discord             #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, size=10000):
+        self.size = size
+        self.items = OrderedDict()
+        self.generation = 0
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        return default
+
+    def set(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    # Only store a value read from the database if nothing was invalidated while reading it
+    def fill(self, key, value, generation):
+        if generation == self.generation:
+            self.set(key, value)
+
+    def invalidate(self):
+        self.generation += 1
+
+    def keys(self):
+        return list(self.items)
+
+    def remove(self, key):
+        self.generation += 1
+        self.items.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self.items.clear()
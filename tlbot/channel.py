@@ -0,0 +1,178 @@
+###############################################################################
+#   TransportLayerBot: Control Channel - All-in-one modular bot for Discord   #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from TLLogger import logger
+import asyncio
+import json
+import struct
+
+log = logger.get_logger(__name__)
+
+# Frames are a big-endian length followed by a JSON list of commands
+HEADER = struct.Struct("!I")
+
+def encode(commands):
+    data = json.dumps(commands).encode()
+    return HEADER.pack(len(data)) + data
+
+class FrameReader:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while len(self.buffer) >= HEADER.size:
+            length, = HEADER.unpack_from(self.buffer)
+            if len(self.buffer) < HEADER.size + length:
+                break
+            frames.append(json.loads(self.buffer[HEADER.size:HEADER.size + length].decode()))
+            del(self.buffer[:HEADER.size + length])
+        return frames
+
+class Controller:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = FrameReader()
+        self.commands = []
+
+    def send_message(self, channel_id, content):
+        self.commands.append({"command": "send", "channel": channel_id, "content": content})
+
+    def subscribe(self, *events):
+        self.commands.append({"command": "subscribe", "events": events})
+
+    def unsubscribe(self, *events):
+        self.commands.append({"command": "unsubscribe", "events": events})
+
+    def request_stats(self):
+        self.commands.append({"command": "stats"})
+
+    def reload(self):
+        self.commands.append({"command": "reload"})
+
+    def shutdown(self):
+        self.commands.append({"command": "shutdown"})
+
+    def flush(self):
+        if self.commands:
+            commands, self.commands = self.commands, []
+            self.sock.sendall(encode(commands))
+
+    def poll(self):
+        self.sock.setblocking(False)
+        replies = []
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                for frame in self.reader.feed(data):
+                    replies.extend(frame)
+        except BlockingIOError:
+            pass
+        finally:
+            self.sock.setblocking(True)
+        return replies
+
+class ClientChannel:
+    def __init__(self, transportlayerbot, sock):
+        self.transportlayerbot = transportlayerbot
+        self.sock = sock
+        self.reader = FrameReader()
+        self.sock.setblocking(False)
+        self.commands = {
+            "send": self.send,
+            "subscribe": self.subscribe,
+            "unsubscribe": self.unsubscribe,
+            "stats": self.stats,
+            "reload": self.reload,
+            "shutdown": self.shutdown
+        }
+        self.replies = asyncio.Queue()
+        self.transportlayerbot.loop.add_reader(self.sock.fileno(), self.read)
+        self.writer = self.transportlayerbot.loop.create_task(self.write())
+
+    def read(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return
+        if not data:
+            log.warn("Control channel closed")
+            self.transportlayerbot.loop.remove_reader(self.sock.fileno())
+            return
+        for frame in self.reader.feed(data):
+            for command in frame:
+                if command.get("command") in self.commands:
+                    try:
+                        self.commands[command["command"]](command)
+                    except Exception:
+                        log.exception(f"Error while running control command {command['command']}")
+                else:
+                    log.error(f"Unknown control command {command.get('command')}")
+
+    def reply(self, replies):
+        self.replies.put_nowait(encode(replies))
+
+    async def write(self):
+        # Only this task writes to the socket, so frames are never interleaved
+        while True:
+            data = await self.replies.get()
+            while not self.replies.empty():
+                data += self.replies.get_nowait()
+            try:
+                await self.transportlayerbot.loop.sock_sendall(self.sock, data)
+            except OSError:
+                log.exception("Could not send control channel reply")
+
+    def send(self, command):
+        channel = self.transportlayerbot.get_channel(command["channel"])
+        if channel:
+            self.transportlayerbot.loop.create_task(self.transportlayerbot.send_message(channel, command["content"]))
+        else:
+            log.error(f"Could not send to channel {command['channel']} (channel not found)")
+
+    def subscribe(self, command):
+        self.transportlayerbot.feed.subscribe(*command["events"])
+
+    def unsubscribe(self, command):
+        self.transportlayerbot.feed.unsubscribe(*command["events"])
+
+    def stats(self, command):
+        handlers = []
+        handler_stats = self.transportlayerbot.get_handler_stats()
+        for event, module_name, handler in handler_stats:
+            summary = handler_stats[(event, module_name, handler)]
+            handlers.append({
+                "event": event,
+                "module": module_name,
+                "handler": handler,
+                "count": summary["count"],
+                "total": summary["total"],
+                "p99": summary["p99"]
+            })
+        self.reply([{"reply": "stats", "handlers": handlers, "queue": self.transportlayerbot.get_queue_stats()}])
+
+    def reload(self, command):
+        self.transportlayerbot.reload_plugins()
+        self.reply([{"reply": "reload", "modules": [module.__name__ for module in self.transportlayerbot.ext.modules]}])
+
+    def shutdown(self, command):
+        log.info("Shutdown requested through control channel")
+        self.transportlayerbot.loop.create_task(self.transportlayerbot.logout())
@@ -19,25 +19,54 @@
 from TLLogger import logger
 import discord
 import asyncio
-from time import time
-from uuid import uuid4
 from copy import deepcopy
+from time import perf_counter
 from tlbot import extender
 from tlbot import commander
 from tlbot import db_tools
+from tlbot import scheduler
+from tlbot import metrics
+from tlbot import workqueue
+from tlbot import feed
+from tlbot import executor
 
 log = logger.get_logger(__name__)
 
+# Message categories
+MESSAGE_SELF = 0x1
+MESSAGE_BOT = 0x2
+MESSAGE_PRIVATE = 0x4
+
+# Event, categories it excludes, categories it requires
+MESSAGE_EVENTS = (
+    ("on_message", 0, 0),
+    ("on_message_noself", MESSAGE_SELF, 0),
+    ("on_message_nobot", MESSAGE_BOT, 0),
+    ("on_message_noprivate", MESSAGE_PRIVATE, 0),
+    ("on_message_noprivate_noself", MESSAGE_PRIVATE | MESSAGE_SELF, 0),
+    ("on_message_noprivate_nobot", MESSAGE_PRIVATE | MESSAGE_BOT, 0),
+    ("on_message_private", 0, MESSAGE_PRIVATE),
+    ("on_message_private_noself", MESSAGE_SELF, MESSAGE_PRIVATE)
+)
+MESSAGE_SEND_EVENTS = (
+    ("on_message_send", 0, 0),
+    ("on_message_send_noprivate", MESSAGE_PRIVATE, 0),
+    ("on_message_send_private", 0, MESSAGE_PRIVATE)
+)
+
 class TransportLayerBot(discord.Client):
-    def __init__(self, *args, tl_settings, tl_queue, **kwargs):
+    def __init__(self, *args, tl_settings, tl_queue, tl_feed=(), **kwargs):
         super().__init__(*args, **kwargs)
         self.queue = tl_queue
+        self.feed = feed.EventFeed(self, tl_queue, tl_feed)
         self.db = {
             "name": tl_settings["DB_NAME"],
             "host": tl_settings["DB_HOST"],
             "port": tl_settings["DB_PORT"]
         }
-        self.loop_time = 0.5
+        self.handler_limit = 4
+        self.handler_timeout = 30
+        self.stats_interval = 600
         self.events = {
             "on_ready": {},
             "on_bot_ready": {},
@@ -83,7 +112,27 @@ class TransportLayerBot(discord.Client):
         }
         self.on_bot_ready_run = False
         self.priority_events = deepcopy(self.events)
+        self.concurrent_events = deepcopy(self.events)
+        self.priority_handlers = {}
+        self.handlers = {}
+        self.concurrent_handlers = {}
+        for event in self.events:
+            self.priority_handlers[event] = ()
+            self.handlers[event] = ()
+            self.concurrent_handlers[event] = ()
+        self.message_routes = self.build_routes(MESSAGE_EVENTS)
+        self.message_send_routes = self.build_routes(MESSAGE_SEND_EVENTS)
+        self.handler_limits = {}
+        self.handler_timeouts = {}
+        self.handler_stats = {}
         self.user_choices = {}
+        self.scheduler = scheduler.Scheduler(self)
+        self.scheduler.schedule(self.stats_interval, self.log_handler_stats, interval=self.stats_interval)
+        if tl_settings.get("QUEUE_SIZE"):
+            self.work_queue = workqueue.WorkQueue(self, workers=tl_settings.get("WORKERS", 4), size=tl_settings["QUEUE_SIZE"], hold=tl_settings.get("QUEUE_HOLD", 5))
+        else:
+            self.work_queue = None
+        self.executor = executor.Executor(self, threads=tl_settings.get("THREADS", 4), processes=tl_settings.get("PROCESSES", 2), queue_limit=tl_settings.get("EXECUTOR_QUEUE", 100))
         self.ext = extender.Extender(self)
         self.ext.load()
         self.cmd = commander.Commander(self)
@@ -94,18 +143,26 @@ class TransportLayerBot(discord.Client):
     # Database connection
     async def connect(self):
         self.db = db_tools.BotDatabase(name=self.db["name"], host=self.db["host"], port=self.db["port"])
+        await self.db.ensure_indexes()
         await super().connect()
 
+    async def close(self):
+        self.scheduler.stop()
+        if self.work_queue:
+            self.work_queue.stop()
+        self.executor.shutdown()
+        try:
+            await super().close()
+        finally:
+            if isinstance(self.db, db_tools.BotDatabase):
+                await self.db.close()
+
 
     # Event Handlers
 
     async def on_ready(self):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_ready"
-            }
-        )
+        # Feed updater
+        self.feed.publish("on_ready")
 
         # Server member state tracker
         last_state = await self.db.server_get_ids({"member": True})
@@ -114,664 +171,351 @@ class TransportLayerBot(discord.Client):
                 await self.db.server_join(server.id)
             elif server.id in last_state:
                 last_state.remove(server.id)
-        for server in last_state:
-            await self.db.server_leave(server.id)
+        for server_id in last_state:
+            await self.db.server_leave(server_id)
+        server_ids = []
+        for server in self.servers:
+            server_ids.append(server.id)
+        await self.db.server_load_prefixes(server_ids)
 
-        # Priority Event Handler
-        if not self.on_bot_ready_run:
-            for module in self.priority_events["on_bot_ready"]:
-                for function in self.priority_events["on_bot_ready"][module]:
-                    await function(self)
-        for module in self.priority_events["on_ready"]:
-            for function in self.priority_events["on_ready"][module]:
-                await function(self)
-        # Standard Event Handler
         if not self.on_bot_ready_run:
-            for module in self.events["on_bot_ready"]:
-                for function in self.events["on_bot_ready"][module]:
-                    await function(self)
-        for module in self.events["on_ready"]:
-            for function in self.events["on_ready"][module]:
-                await function(self)
+            await self.run_handlers("on_bot_ready")
+        await self.run_handlers("on_ready")
 
         self.on_bot_ready_run = True
 
     async def on_resumed(self):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_resumed"
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_resumed"]:
-            for function in self.priority_events["on_resumed"][module]:
-                await function(self)
-        # Standard Event Handler
-        for module in self.events["on_resumed"]:
-            for function in self.events["on_resumed"][module]:
-                await function(self)
+        # Feed updater
+        self.feed.publish("on_resumed")
+
+        await self.run_handlers("on_resumed")
 
     async def on_message(self, message):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_message",
-                "message": message
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_message"]:
-            for function in self.priority_events["on_message"][module]:
-                await function(self, message)
-        # Standard Event Handler
-        for module in self.events["on_message"]:
-            for function in self.events["on_message"][module]:
-                await function(self, message)
-        # Special Handlers
-        if not message.author == self.user:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_noself"]:
-                for function in self.priority_events["on_message_noself"][module]:
-                    await function(self, message)
-            for module in self.events["on_message_noself"]:
-                for function in self.events["on_message_noself"][module]:
-                    await function(self, message)
-        if not message.author.bot:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_nobot"]:
-                for function in self.priority_events["on_message_nobot"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_nobot"]:
-                for function in self.events["on_message_nobot"][module]:
-                    await function(self, message)
-        if not message.channel.is_private == self.user:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_noprivate"]:
-                for function in self.priority_events["on_message_noprivate"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_noprivate"]:
-                for function in self.events["on_message_noprivate"][module]:
-                    await function(self, message)
-        if not message.channel.is_private and not message.author == self.user:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_noprivate_noself"]:
-                for function in self.priority_events["on_message_noprivate_noself"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_noprivate_noself"]:
-                for function in self.events["on_message_noprivate_noself"][module]:
-                    await function(self, message)
-        if not message.channel.is_private and not message.author.bot:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_noprivate_nobot"]:
-                for function in self.priority_events["on_message_noprivate_nobot"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_noprivate_nobot"]:
-                for function in self.events["on_message_noprivate_nobot"][module]:
-                    await function(self, message)
+        # Feed updater
+        self.feed.publish("on_message", message)
+
+        category = 0
+        author = message.author
+        if author == self.user:
+            category |= MESSAGE_SELF
+        if author.bot:
+            category |= MESSAGE_BOT
         if message.channel.is_private:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_private"]:
-                for function in self.priority_events["on_message_private"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_private"]:
-                for function in self.events["on_message_private"][module]:
-                    await function(self, message)
-        if message.channel.is_private and not message.author == self.user:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_private_noself"]:
-                for function in self.priority_events["on_message_private_noself"][module]:
-                    await function(self, message)
-            # Standard Event Handler
-            for module in self.events["on_message_private_noself"]:
-                for function in self.events["on_message_private_noself"][module]:
-                    await function(self, message)
+            category |= MESSAGE_PRIVATE
+        for event in self.message_routes[category]:
+            await self.run_handlers(event, message)
 
     async def on_message_delete(self, message):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_message_delete",
-                "message": message
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_message_delete"]:
-            for function in self.priority_events["on_message_delete"][module]:
-                await function(self, message)
-        # Standard Event Handler
-        for module in self.events["on_message_delete"]:
-            for function in self.events["on_message_delete"][module]:
-                await function(self, message)
+        # Feed updater
+        self.feed.publish("on_message_delete", message)
+
+        await self.run_handlers("on_message_delete", message)
 
     async def on_message_edit(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_message_edit",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_message_edit"]:
-            for function in self.priority_events["on_message_edit"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_message_edit"]:
-            for function in self.events["on_message_edit"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_message_edit", before, after)
+
+        await self.run_handlers("on_message_edit", before, after)
 
     async def on_reaction_add(self, reaction, user):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_reaction_add",
-                "reaction": reaction,
-                "user": user
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_reaction_add"]:
-            for function in self.priority_events["on_reaction_add"][module]:
-                await function(self, reaction, user)
-        # Standard Event Handler
-        for module in self.events["on_reaction_add"]:
-            for function in self.events["on_reaction_add"][module]:
-                await function(self, reaction, user)
+        # Feed updater
+        self.feed.publish("on_reaction_add", reaction, user)
+
+        await self.route_reaction(reaction, user)
+        await self.run_handlers("on_reaction_add", reaction, user)
 
     async def on_reaction_remove(self, reaction, user):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_reaction_remove",
-                "reaction": reaction,
-                "user": user
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_reaction_remove"]:
-            for function in self.priority_events["on_reaction_remove"][module]:
-                await function(self, reaction, user)
-        # Standard Event Handler
-        for module in self.events["on_reaction_remove"]:
-            for function in self.events["on_reaction_remove"][module]:
-                await function(self, reaction, user)
+        # Feed updater
+        self.feed.publish("on_reaction_remove", reaction, user)
+
+        await self.run_handlers("on_reaction_remove", reaction, user)
 
     async def on_reaction_clear(self, message, reactions):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_reaction_clear",
-                "message": message,
-                "reactions": reactions
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_reaction_clear"]:
-            for function in self.priority_events["on_reaction_clear"][module]:
-                await function(self, message, reactions)
-        # Standard Event Handler
-        for module in self.events["on_reaction_clear"]:
-            for function in self.events["on_reaction_clear"][module]:
-                await function(self, message, reactions)
+        # Feed updater
+        self.feed.publish("on_reaction_clear", message, reactions)
+
+        await self.run_handlers("on_reaction_clear", message, reactions)
 
     async def on_channel_delete(self, channel):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_channel_delete",
-                "channel": channel
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_channel_delete"]:
-            for function in self.priority_events["on_channel_delete"][module]:
-                await function(self, channel)
-        # Standard Event Handler
-        for module in self.events["on_channel_delete"]:
-            for function in self.events["on_channel_delete"][module]:
-                await function(self, channel)
+        # Feed updater
+        self.feed.publish("on_channel_delete", channel)
+
+        await self.run_handlers("on_channel_delete", channel)
 
     async def on_channel_create(self, channel):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_channel_create",
-                "channel": channel
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_channel_create"]:
-            for function in self.priority_events["on_channel_create"][module]:
-                await function(self, channel)
-        # Standard Event Handler
-        for module in self.events["on_channel_create"]:
-            for function in self.events["on_channel_create"][module]:
-                await function(self, channel)
+        # Feed updater
+        self.feed.publish("on_channel_create", channel)
+
+        await self.run_handlers("on_channel_create", channel)
 
     async def on_channel_update(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_channel_update",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_channel_update"]:
-            for function in self.priority_events["on_channel_update"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_channel_update"]:
-            for function in self.events["on_channel_update"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_channel_update", before, after)
+
+        await self.run_handlers("on_channel_update", before, after)
 
     async def on_channel_pins_update(self, channel, last_pin):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_channel_pins_update",
-                "channel": channel,
-                "last_pin": last_pin
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_channel_pins_update"]:
-            for function in self.priority_events["on_channel_pins_update"][module]:
-                await function(self, channel, last_pin)
-        # Standard Event Handler
-        for module in self.events["on_channel_pins_update"]:
-            for function in self.events["on_channel_pins_update"][module]:
-                await function(self, channel, last_pin)
+        # Feed updater
+        self.feed.publish("on_channel_pins_update", channel, last_pin)
+
+        await self.run_handlers("on_channel_pins_update", channel, last_pin)
 
     async def on_member_join(self, member):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_member_join",
-                "member": member
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_member_join"]:
-            for function in self.priority_events["on_member_join"][module]:
-                await function(self, member)
-        # Standard Event Handler
-        for module in self.events["on_member_join"]:
-            for function in self.events["on_member_join"][module]:
-                await function(self, member)
+        # Feed updater
+        self.feed.publish("on_member_join", member)
+
+        await self.run_handlers("on_member_join", member)
 
     async def on_member_remove(self, member):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_member_remove",
-                "member": member
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_member_remove"]:
-            for function in self.priority_events["on_member_remove"][module]:
-                await function(self, member)
-        # Standard Event Handler
-        for module in self.events["on_member_remove"]:
-            for function in self.events["on_member_remove"][module]:
-                await function(self, member)
+        # Feed updater
+        self.feed.publish("on_member_remove", member)
+
+        await self.run_handlers("on_member_remove", member)
 
     async def on_member_update(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_member_update",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_member_update"]:
-            for function in self.priority_events["on_member_update"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_member_update"]:
-            for function in self.events["on_member_update"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_member_update", before, after)
+
+        self.db.permissions_invalidate(after.server.id, after.id)
+        await self.run_handlers("on_member_update", before, after)
 
     async def on_server_join(self, server):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_join",
-                "server": server
-            }
-        )
-
-        # Priority Event Handler
-        await self.db.server_join(server.id)
-        for module in self.priority_events["on_server_join"]:
-            for function in self.priority_events["on_server_join"][module]:
-                await function(self, server)
-        # Standard Event Handler
+        # Feed updater
+        self.feed.publish("on_server_join", server)
+
         await self.db.server_join(server.id)
-        for module in self.events["on_server_join"]:
-            for function in self.events["on_server_join"][module]:
-                await function(self, server)
+        await self.run_handlers("on_server_join", server)
 
     async def on_server_remove(self, server):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_remove",
-                "server": server
-            }
-        )
-
-        # Priority Event Handler
-        await self.db.server_leave(server.id)
-        for module in self.priority_events["on_server_remove"]:
-            for function in self.priority_events["on_server_remove"][module]:
-                await function(self, server)
-        # Standard Event Handler
+        # Feed updater
+        self.feed.publish("on_server_remove", server)
+
         await self.db.server_leave(server.id)
-        for module in self.events["on_server_remove"]:
-            for function in self.events["on_server_remove"][module]:
-                await function(self, server)
+        await self.run_handlers("on_server_remove", server)
 
     async def on_server_role_create(self, role):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_role_create",
-                "role": role
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_role_create"]:
-            for function in self.priority_events["on_server_role_create"][module]:
-                await function(self, role)
-        # Standard Event Handler
-        for module in self.events["on_server_role_create"]:
-            for function in self.events["on_server_role_create"][module]:
-                await function(self, role)
+        # Feed updater
+        self.feed.publish("on_server_role_create", role)
+
+        await self.run_handlers("on_server_role_create", role)
 
     async def on_server_role_delete(self, role):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_role_delete",
-                "role": role
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_role_delete"]:
-            for function in self.priority_events["on_server_role_delete"][module]:
-                await function(self, role)
-        # Standard Event Handler
-        for module in self.events["on_server_role_delete"]:
-            for function in self.events["on_server_role_delete"][module]:
-                await function(self, role)
+        # Feed updater
+        self.feed.publish("on_server_role_delete", role)
+
+        self.db.permissions_invalidate(role.server.id)
+        await self.run_handlers("on_server_role_delete", role)
 
     async def on_server_role_update(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_role_update",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_role_update"]:
-            for function in self.priority_events["on_server_role_update"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_server_role_update"]:
-            for function in self.events["on_server_role_update"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_server_role_update", before, after)
+
+        self.db.permissions_invalidate(after.server.id)
+        await self.run_handlers("on_server_role_update", before, after)
 
     async def on_server_emojis_update(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_emojus_update",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_emojis_update"]:
-            for function in self.priority_events["on_server_emojis_update"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_server_emojis_update"]:
-            for function in self.events["on_server_emojis_update"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_server_emojis_update", before, after)
+
+        await self.run_handlers("on_server_emojis_update", before, after)
 
     async def on_server_available(self, server):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_available",
-                "server": server
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_available"]:
-            for function in self.priority_events["on_server_available"][module]:
-                await function(self, server)
-        # Standard Event Handler
-        for module in self.events["on_server_available"]:
-            for function in self.events["on_server_available"][module]:
-                await function(self, server)
+        # Feed updater
+        self.feed.publish("on_server_available", server)
+
+        await self.run_handlers("on_server_available", server)
 
     async def on_server_unavailable(self, server):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_server_unavailable",
-                "server": server
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_server_unavailable"]:
-            for function in self.priority_events["on_server_unavailable"][module]:
-                await function(self, server)
-        # Standard Event Handler
-        for module in self.events["on_server_unavailable"]:
-            for function in self.events["on_server_unavailable"][module]:
-                await function(self, server)
+        # Feed updater
+        self.feed.publish("on_server_unavailable", server)
+
+        await self.run_handlers("on_server_unavailable", server)
 
     async def on_voice_state_update(self, before, after):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_voice_state_update",
-                "before": before,
-                "after": after
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_voice_state_update"]:
-            for function in self.priority_events["on_voice_state_update"][module]:
-                await function(self, before, after)
-        # Standard Event Handler
-        for module in self.events["on_voice_state_update"]:
-            for function in self.events["on_voice_state_update"][module]:
-                await function(self, before, after)
+        # Feed updater
+        self.feed.publish("on_voice_state_update", before, after)
+
+        await self.run_handlers("on_voice_state_update", before, after)
 
     async def on_member_ban(self, member):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_member_ban",
-                "member": member
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_member_ban"]:
-            for function in self.priority_events["on_member_ban"][module]:
-                await function(self, member)
-        # Standard Event Handler
-        for module in self.events["on_member_ban"]:
-            for function in self.events["on_member_ban"][module]:
-                await function(self, member)
+        # Feed updater
+        self.feed.publish("on_member_ban", member)
+
+        await self.run_handlers("on_member_ban", member)
 
     async def on_member_unban(self, server, user):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_member_unban",
-                "server": server,
-                "user": user
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_member_unban"]:
-            for function in self.priority_events["on_member_unban"][module]:
-                await function(self, server, user)
-        # Standard Event Handler
-        for module in self.events["on_member_unban"]:
-            for function in self.events["on_member_unban"][module]:
-                await function(self, server, user)
+        # Feed updater
+        self.feed.publish("on_member_unban", server, user)
+
+        await self.run_handlers("on_member_unban", server, user)
 
     async def on_typing(self, channel, user, when):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_typing",
-                "channel": channel,
-                "user": user,
-                "when": when
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_typing"]:
-            for function in self.priority_events["on_typing"][module]:
-                await function(self, channel, user, when)
-        # Standard Event Handler
-        for module in self.events["on_typing"]:
-            for function in self.events["on_typing"][module]:
-                await function(self, channel, user, when)
+        # Feed updater
+        self.feed.publish("on_typing", channel, user, when)
+
+        await self.run_handlers("on_typing", channel, user, when)
 
     async def on_group_join(self, channel, user):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_group_join",
-                "channel": channel,
-                "user": user
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_group_join"]:
-            for function in self.priority_events["on_group_join"][module]:
-                await function(self, channel, user)
-        # Standard Event Handler
-        for module in self.events["on_group_join"]:
-            for function in self.events["on_group_join"][module]:
-                await function(self, channel, user)
+        # Feed updater
+        self.feed.publish("on_group_join", channel, user)
+
+        await self.run_handlers("on_group_join", channel, user)
 
     async def on_group_remove(self, channel, user):
-        # Queue updater
-        self.queue.put(
-            {
-                "event": "on_group_remove",
-                "channel": channel,
-                "user": user
-            }
-        )
-
-        # Priority Event Handler
-        for module in self.priority_events["on_group_remove"]:
-            for function in self.priority_events["on_group_remove"][module]:
-                await function(self, channel, user)
-        # Standard Event Handler
-        for module in self.events["on_group_remove"]:
-            for function in self.events["on_group_remove"][module]:
-                await function(self, channel, user)
+        # Feed updater
+        self.feed.publish("on_group_remove", channel, user)
 
+        await self.run_handlers("on_group_remove", channel, user)
 
     # Request Proxies
 
     async def send_message(self, destination, content=None, *message, **kwargs):
         response = await super().send_message(destination, content, *message, **kwargs)
-        # Priority Event Handler
-        for module in self.priority_events["on_message_send"]:
-            for function in self.priority_events["on_message_send"][module]:
-                await function(self, response)
-        # Standard Event Handler
-        for module in self.events["on_message_send"]:
-            for function in self.events["on_message_send"][module]:
-                await function(self, response)
-        # Special Handlers
-        if not response.channel.is_private:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_send_noprivate"]:
-                for function in self.priority_events["on_message_send_noprivate"][module]:
-                    await function(self, response)
-            # Standard Event Handler
-            for module in self.events["on_message_send_noprivate"]:
-                for function in self.events["on_message_send_noprivate"][module]:
-                    await function(self, response)
-        if response.channel.is_private:
-            # Priority Event Handler
-            for module in self.priority_events["on_message_send_private"]:
-                for function in self.priority_events["on_message_send_private"][module]:
-                    await function(self, response)
-            # Standard Event Handler
-            for module in self.events["on_message_send_private"]:
-                for function in self.events["on_message_send_private"][module]:
-                    await function(self, response)
+        category = MESSAGE_PRIVATE if response.channel.is_private else 0
+        for event in self.message_send_routes[category]:
+            await self.run_handlers(event, response)
         return response
 
 
     # Utility Functions
-    async def add_handler(self, module_name, handler, function, priority=False):
+
+    def build_handlers(self, event):
+        for events, handlers in ((self.priority_events, self.priority_handlers), (self.events, self.handlers)):
+            functions = []
+            for module in events[event]:
+                for function in events[event][module]:
+                    functions.append((function, self.get_stats(event, module, function)))
+            handlers[event] = tuple(functions)
+        concurrent_handlers = []
+        for module in self.concurrent_events[event]:
+            for function in self.concurrent_events[event][module]:
+                concurrent_handlers.append((module, function, self.get_stats(event, module, function)))
+        self.concurrent_handlers[event] = tuple(concurrent_handlers)
+        self.message_routes = self.build_routes(MESSAGE_EVENTS)
+        self.message_send_routes = self.build_routes(MESSAGE_SEND_EVENTS)
+
+    def build_routes(self, message_events):
+        routes = []
+        for category in range((MESSAGE_SELF | MESSAGE_BOT | MESSAGE_PRIVATE) + 1):
+            events = []
+            for event, excludes, requires in message_events:
+                if category & excludes or (category & requires) != requires:
+                    continue
+                if self.priority_handlers[event] or self.handlers[event] or self.concurrent_handlers[event]:
+                    events.append(event)
+            routes.append(tuple(events))
+        return tuple(routes)
+
+    def register_handler(self, module_name, handler, function, priority=False, concurrent=False):
         if priority:
             events = self.priority_events
+        elif concurrent:
+            events = self.concurrent_events
         else:
             events = self.events
 
+        if not handler in events:
+            log.error(f"Could not register {function.__name__} from {module_name} (unknown event {handler})")
+            return
         if not module_name in events[handler]:
             events[handler][module_name] = []
         events[handler][module_name].append(function)
+        self.build_handlers(handler)
+
+    def remove_handlers(self, module_name):
+        for events in (self.priority_events, self.events, self.concurrent_events):
+            for handler in events:
+                if module_name in events[handler]:
+                    del(events[handler][module_name])
+                    self.build_handlers(handler)
+        self.handler_limits.pop(module_name, None)
+        self.handler_timeouts.pop(module_name, None)
+        for key in list(self.handler_stats):
+            if key[1] == module_name:
+                del(self.handler_stats[key])
+
+    def set_handler_limits(self, module_name, limit=None, timeout=None):
+        self.handler_limits[module_name] = asyncio.Semaphore(limit or self.handler_limit)
+        self.handler_timeouts[module_name] = timeout or self.handler_timeout
+
+    async def run_concurrent_handler(self, module_name, function, stats, *args):
+        if not module_name in self.handler_limits:
+            self.set_handler_limits(module_name)
+        async with self.handler_limits[module_name]:
+            start = perf_counter()
+            try:
+                await asyncio.wait_for(function(self, *args), self.handler_timeouts[module_name])
+            except asyncio.TimeoutError:
+                log.warn(f"Cancelled handler {function.__name__} from {module_name} (timed out after {self.handler_timeouts[module_name]}s)")
+            except Exception:
+                log.exception(f"Error in handler {function.__name__} from {module_name}")
+            finally:
+                stats.record(perf_counter() - start)
+
+    async def run_handlers(self, event, *args):
+        for function, stats in self.priority_handlers[event]:
+            start = perf_counter()
+            try:
+                await function(self, *args)
+            finally:
+                stats.record(perf_counter() - start)
+        if not self.handlers[event] and not self.concurrent_handlers[event]:
+            return
+        if self.work_queue:
+            self.work_queue.submit(workqueue.get_server_id(args), event, args)
+        else:
+            await self.run_standard_handlers(event, *args)
+
+    async def run_standard_handlers(self, event, *args):
+        for function, stats in self.handlers[event]:
+            start = perf_counter()
+            try:
+                await function(self, *args)
+            finally:
+                stats.record(perf_counter() - start)
+        if self.concurrent_handlers[event]:
+            await asyncio.gather(*[self.run_concurrent_handler(module, function, stats, *args) for module, function, stats in self.concurrent_handlers[event]])
+
+    def get_stats(self, event, module_name, function):
+        key = (event, module_name, function.__qualname__)
+        if not key in self.handler_stats:
+            self.handler_stats[key] = metrics.HandlerStats()
+        return self.handler_stats[key]
+
+    def get_handler_stats(self):
+        stats = {}
+        for key in self.handler_stats:
+            if self.handler_stats[key].count:
+                stats[key] = self.handler_stats[key].summary()
+        return stats
+
+    async def log_handler_stats(self, top=10):
+        stats = self.get_handler_stats()
+        slowest = sorted(stats, key=lambda key: stats[key]["total"], reverse=True)[:top]
+        for event, module_name, handler in slowest:
+            summary = stats[(event, module_name, handler)]
+            log.info(f"{event} {module_name}.{handler}: {summary['count']} calls, {summary['total']:.3f}s total, {summary['mean'] * 1000:.2f}ms mean, p99 <= {summary['p99'] * 1000:.0f}ms")
+        if self.work_queue:
+            queue_stats = self.get_queue_stats()
+            log.info(f"Work queue: {queue_stats['pending']} pending across {queue_stats['servers']} servers (deepest {queue_stats['deepest']}), dropped {queue_stats['dropped']}")
+
+    def get_queue_stats(self):
+        if self.work_queue:
+            return self.work_queue.stats()
+        return None
+
+    async def add_handler(self, module_name, handler, function, priority=False, concurrent=False):
+        self.register_handler(module_name, handler, function, priority, concurrent)
+
+    def reload_plugins(self):
+        self.ext.load()
+        self.cmd.load()
 
     async def run_in(self, seconds, function, *args, **kwargs):
-        async def _run():
-            await asyncio.sleep(seconds)
-            await function(*args, **kwargs)
-        self.loop.create_task(_run())
+        return self.scheduler.schedule(seconds, function, args, kwargs)
+
+    async def run_every(self, seconds, function, *args, **kwargs):
+        return self.scheduler.schedule(seconds, function, args, kwargs, interval=seconds)
 
     async def get_user_role_ids(self, member):
         roles = []
@@ -779,6 +523,15 @@ class TransportLayerBot(discord.Client):
             roles.append(role.id)
         return roles
 
+    async def route_reaction(self, reaction, user):
+        choice = self.user_choices.get(reaction.message.id)
+        if not choice:
+            return
+        if choice["expires"] and choice["expires"] < self.loop.time():
+            del(self.user_choices[reaction.message.id])
+            return
+        await choice["check"](reaction, user)
+
     async def wait_for_choice(self, messages, options=['✅', '❌'], users=None, timeout=None, first=True, return_on=None, limit=0):
         for message in messages:
             for emoji in options:
@@ -793,31 +546,44 @@ class TransportLayerBot(discord.Client):
                 user_ids.append(user.id)
 
         reactions = {}
-        async def _check_reaction(_, reaction, user):
-            if not user.id == self.user.id and reaction.message.id in message_ids:
+        done = self.loop.create_future()
+        def _finished():
+            if not unresponded:
+                return True
+            if limit and len(messages) - len(unresponded) >= limit:
+                return True
+            if return_on:
+                return not set(reactions).isdisjoint(return_on)
+            return first and len(reactions) > 0
+        async def _check_reaction(reaction, user):
+            if not user.id == self.user.id:
                 emoji = str(reaction.emoji)
                 if (not emoji in options) or (users and (not user.id in user_ids)):
                     await self.remove_reaction(reaction.message, emoji, user)
                     return
-                unresponded.remove(reaction.message.id)
+                if reaction.message.id in unresponded:
+                    unresponded.remove(reaction.message.id)
                 if not emoji in reactions:
                     reactions[emoji] = []
                 reactions[emoji].append(user)
-        handler_id = str(uuid4())
-        self.events["on_reaction_add"][handler_id] = [_check_reaction]
-
-        if timeout:
-            stop = time() + timeout
-        while (not timeout or time() < stop) and unresponded and (not limit or len(messages) - len(unresponded) < limit):
-            if len(reactions) > 0:
-                if (first and return_on) or return_on:
-                    for reaction in reactions:
-                        if reaction in return_on:
-                            break
-                elif first:
-                    break
-            await asyncio.sleep(self.loop_time)
-        del(self.events["on_reaction_add"][handler_id])
+                if not done.done() and _finished():
+                    done.set_result(True)
+        choice = {
+            "check": _check_reaction,
+            "expires": self.loop.time() + timeout if timeout else None
+        }
+        for message_id in message_ids:
+            self.user_choices[message_id] = choice
+
+        try:
+            if not _finished():
+                await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for message_id in message_ids:
+                if self.user_choices.get(message_id) is choice:
+                    del(self.user_choices[message_id])
         for message in messages:
             await self.clear_reactions(message)
 
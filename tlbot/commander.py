@@ -18,6 +18,10 @@
 
 from TLLogger import logger
 from tlbot import db_commander
+from tlbot import ratelimit
+from tlbot import arguments
+from tlbot import executor
+from tlbot import lang
 
 log = logger.get_logger(__name__)
 
@@ -25,9 +29,12 @@ class Commander:
     def __init__(self, transportlayerbot):
         self.transportlayerbot = transportlayerbot
         self.commands = {}
+        self.index = {}
+        self.limiter = ratelimit.RateLimiter()
 
     def load(self):
         self.commands = {}
+        self.index = {}
         for module in self.transportlayerbot.ext.modules:
             if "commands" in module.TL_META:
                 self.commands[module.__name__] = []
@@ -41,14 +48,37 @@ class Commander:
                         "use_permissions": True,
                         "permissions": 0,
                         "use_roles": False,
-                        "roles": []
+                        "roles": [],
+                        "aliases": [],
+                        "rate_limits": {},
+                        "executor": None,
+                        "arguments": None
                     }
                     default_parameters.update(command)
+                    if default_parameters["arguments"]:
+                        try:
+                            default_parameters["parser"] = arguments.Parser(default_parameters["arguments"])
+                        except ValueError:
+                            log.exception(f"Refusing to load command {default_parameters.get('name')} from {module.__name__} (invalid arguments)")
+                            continue
+                    else:
+                        default_parameters["parser"] = None
+                    if default_parameters["executor"] and not default_parameters["executor"] in executor.POOLS:
+                        log.error(f"Refusing to load command {default_parameters.get('name')} from {module.__name__} (unknown executor {default_parameters['executor']})")
+                        continue
+                    scopes = [scope for scope in default_parameters["rate_limits"] if not scope in ratelimit.SCOPES]
+                    if scopes:
+                        log.error(f"Refusing to load command {default_parameters.get('name')} from {module.__name__} (unknown rate limit scopes {', '.join(scopes)})")
+                        continue
                     self.commands[module.__name__].append(default_parameters)
+                    for name in [default_parameters["name"]] + list(default_parameters["aliases"]):
+                        if not name in self.index:
+                            self.index[name] = []
+                        self.index[name].append(default_parameters)
 
     async def allowed_to_run(self, command, member, su_check=False):
         role_ids = await self.transportlayerbot.get_user_role_ids(member)
-        permissions = await self.transportlayerbot.db.get_user_permissions(member.id, role_ids)
+        permissions = await self.transportlayerbot.db.get_user_permissions(member.id, role_ids, member.server.id)
         permissions.append(False)
         if su_check:
             permissions[2] = True
@@ -66,20 +96,44 @@ class Commander:
                 return True, permissions
         return False, permissions
 
-    async def run_command(self, name, message, args, su_check=False, force=False):
+    async def run_command(self, name, message, args, su_check=False, force=False, raw=None):
+        if raw is None:
+            raw = " ".join(args)
         sandwich = True
-        for module in self.commands:
-            for command in self.commands[module]:
-                if name == command["name"]:
-                    allowed, permissions = await self.allowed_to_run(command, message.author, su_check)
-                    if force or allowed:
-                        sandwich = False
-                        await command["function"](self.transportlayerbot, message, args, permissions)
+        ran = False
+        usage = None
+        for command in self.index.get(name, ()):
+            if not force and not self.limiter.allow(command, message):
+                log.debug(f"Rate limited {name} for {message.author.id}")
+                sandwich = False
+                continue
+            allowed, permissions = await self.allowed_to_run(command, message.author, su_check)
+            if force or allowed:
+                sandwich = False
+                command_args = args
+                if command["parser"]:
+                    valid, command_args = command["parser"].parse(raw)
+                    if not valid:
+                        if usage is None:
+                            usage = lang.ARG_USAGE.format(error=command_args, name=name, usage=command["parser"].usage)
+                        continue
+                ran = True
+                if command["executor"]:
+                    await self.transportlayerbot.executor.run_command(command, message, command_args, permissions)
+                else:
+                    await command["function"](self.transportlayerbot, message, command_args, permissions)
         for command in await self.transportlayerbot.db.command_find(name, message.server.id):
+            if not force and not self.limiter.allow(command, message):
+                log.debug(f"Rate limited {name} for {message.author.id}")
+                sandwich = False
+                continue
             allowed, permissions = await self.allowed_to_run(command, message.author, su_check)
             if force or allowed:
                 sandwich = False
+                ran = True
                 await db_commander.run_db_command(self.transportlayerbot, message, args, command, permissions)
+        if usage and not ran:
+            await self.transportlayerbot.send_message(message.channel, usage)
         if sandwich:
             if f"{name} {' '.join(args)}" == "make me a sandwich":
                 if not su_check:
@@ -88,20 +142,43 @@ class Commander:
                     await self.transportlayerbot.send_message(message.channel, "Okay.")
 
     async def parse_message(self, message):
-        prefix = await self.transportlayerbot.db.server_get(message.server.id, "prefix")
-        if message.content.startswith(prefix[0]):
-            command, *args = message.content[1:].split()
+        if not self.transportlayerbot.db.prefix_known(message.content):
+            return None, None, None, None
+        prefix, error = await self.transportlayerbot.db.server_get_prefix(message.server.id)
+        if prefix and message.content.startswith(prefix):
+            command, raw = self.split_command(message.content[len(prefix):])
             if command == "sudo":
-                command, *args = args
-                return command, args, True
-            return command, args, False
+                command, raw = self.split_command(raw)
+                return command, raw.split(), True, raw
+            return command, raw.split(), False, raw
         else:
-            return None, None, None
+            return None, None, None, None
+
+    def split_command(self, content):
+        parts = content.split(None, 1)
+        if not parts:
+            return None, ""
+        elif len(parts) == 1:
+            return parts[0], ""
+        return parts[0], parts[1]
 
     async def run_message(self, transportlayerbot, message):
-        command, args, check_su = await self.parse_message(message)
+        command, args, check_su, raw = await self.parse_message(message)
         if command:
-            await self.run_command(command, message, args, check_su)
+            await self.run_command(command, message, args, check_su, raw=raw)
+
+    async def run_member_event(self, transportlayerbot, member, event):
+        for db_event in await self.transportlayerbot.db.event_get(event, member.server.id):
+            await db_commander.run_db_event(self.transportlayerbot, db_event, member)
+
+    async def run_member_join(self, transportlayerbot, member):
+        await self.run_member_event(transportlayerbot, member, "on_member_join")
+
+    async def run_member_remove(self, transportlayerbot, member):
+        await self.run_member_event(transportlayerbot, member, "on_member_remove")
 
     def hook(self):
-        self.transportlayerbot.events["on_message_noprivate_nobot"][__name__] = [self.run_message]
+        self.transportlayerbot.remove_handlers(__name__)
+        self.transportlayerbot.register_handler(__name__, "on_message_noprivate_nobot", self.run_message)
+        self.transportlayerbot.register_handler(__name__, "on_member_join", self.run_member_join)
+        self.transportlayerbot.register_handler(__name__, "on_member_remove", self.run_member_remove)
@@ -17,9 +17,41 @@
 ###############################################################################
 
 from TLLogger import logger
+from discord import utils
+from tlbot import templates
 
 log = logger.get_logger(__name__)
 
+async def run_action(transportlayerbot, action, context, member, channel, message=None):
+    text = action.get("message", action.get("response"))
+    if action["action"] == "reply":
+        if text and channel:
+            await transportlayerbot.send_message(channel, templates.render(text, context))
+    elif action["action"] == "dm":
+        if text:
+            await transportlayerbot.send_message(member, templates.render(text, context))
+    elif action["action"] == "react":
+        if message:
+            await transportlayerbot.add_reaction(message, action["emoji"])
+    elif action["action"] == "role":
+        role = utils.get(member.server.roles, id=action["role"])
+        if not role:
+            log.error(f"Could not find role {action['role']} for {action['name']}")
+            return
+        if role in member.roles:
+            await transportlayerbot.remove_roles(member, role)
+        else:
+            await transportlayerbot.add_roles(member, role)
+        if text and channel:
+            await transportlayerbot.send_message(channel, templates.render(text, context))
+    else:
+        log.error(f"Unknown action {action['action']} for {action['name']}")
+
 async def run_db_command(transportlayerbot, message, args, command, permissions):
-    if command["action"] == "reply":
-        await transportlayerbot.send_message(message.channel, command["response"])
+    context = templates.get_context(message.author, message.server, message.channel, args)
+    await run_action(transportlayerbot, command, context, message.author, message.channel, message)
+
+async def run_db_event(transportlayerbot, event, member):
+    channel = transportlayerbot.get_channel(event["channel"]) if event.get("channel") else None
+    context = templates.get_context(member, member.server, channel)
+    await run_action(transportlayerbot, event, context, member, channel)
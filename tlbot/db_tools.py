@@ -17,22 +17,117 @@
 ###############################################################################
 
 from TLLogger import logger
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import PyMongoError, OperationFailure, DuplicateKeyError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 from tlbot import lang
+from tlbot import cache
 
 log = logger.get_logger(__name__)
 
-DB_VERSION = "0.1"
+DB_VERSION = "0.2"
+DEFAULT_PREFIX = '!'
+CACHE_SIZE = 10000
+WORKERS = 8
+AUDIT_DAYS = 90
+AUDIT_PAGE = 50
+AUDIT_BATCH = 100
+AUDIT_INTERVAL = 5
+
+# Collection, keys and options of every index the bot relies on
+INDEXES = (
+    ("servers", [("id", ASCENDING)], {"unique": True}),
+    ("servers", [("member", ASCENDING)], {}),
+    ("commands", [("owner", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ("commands", [("name", ASCENDING), ("enabled", ASCENDING)], {}),
+    ("commands", [("enabled", ASCENDING)], {}),
+    ("roles", [("owner", ASCENDING), ("id", ASCENDING)], {"unique": True}),
+    ("roles", [("id", ASCENDING)], {}),
+    ("users", [("id", ASCENDING)], {}),
+    ("events", [("owner", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ("events", [("event", ASCENDING), ("enabled", ASCENDING)], {}),
+    ("events", [("name", ASCENDING), ("enabled", ASCENDING)], {}),
+    ("audit", [("server", ASCENDING), ("time", DESCENDING)], {}),
+    ("audit", [("time", ASCENDING)], {"expireAfterSeconds": AUDIT_DAYS * 24 * 60 * 60})
+)
+
+class AsyncCollection:
+    def __init__(self, database, collection):
+        self.database = database
+        self.collection = collection
+
+    async def find(self, *args, **kwargs):
+        return await self.database.run(lambda: list(self.collection.find(*args, **kwargs)))
+
+    async def find_one(self, *args, **kwargs):
+        return await self.database.run(self.collection.find_one, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self.database.run(self.collection.find_one_and_update, *args, **kwargs)
+
+    async def aggregate(self, *args, **kwargs):
+        return await self.database.run(lambda: list(self.collection.aggregate(*args, **kwargs)))
+
+    async def insert_one(self, *args, **kwargs):
+        return await self.database.run(self.collection.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self.database.run(self.collection.insert_many, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self.database.run(self.collection.update_one, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self.database.run(self.collection.delete_one, *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self.database.run(self.collection.create_index, *args, **kwargs)
+
+    async def index_information(self):
+        return await self.database.run(self.collection.index_information)
+
+class AuditWriter:
+    def __init__(self, collection, size=AUDIT_BATCH, interval=AUDIT_INTERVAL):
+        self.collection = collection
+        self.size = size
+        self.interval = interval
+        self.entries = []
+        self.flush_handle = None
+        self.lock = asyncio.Lock()
+
+    def add(self, entry):
+        self.entries.append(entry)
+        if len(self.entries) >= self.size:
+            if not self.lock.locked():
+                asyncio.ensure_future(self.flush())
+        elif not self.flush_handle:
+            self.flush_handle = asyncio.get_event_loop().call_later(self.interval, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        async with self.lock:
+            while self.entries:
+                entries, self.entries = self.entries[:self.size], self.entries[self.size:]
+                try:
+                    await self.collection.insert_many(entries, ordered=False)
+                except PyMongoError:
+                    log.exception(f"Could not write {len(entries)} audit entries")
 
 class BotDatabase:
-    def __init__(self, name="TransportLayerBot", host="127.0.0.1", port=27017):
+    def __init__(self, name="TransportLayerBot", host="127.0.0.1", port=27017, cache_size=CACHE_SIZE, workers=WORKERS, audit_size=AUDIT_BATCH, audit_interval=AUDIT_INTERVAL):
         log.info(f"Connecting to database {name} at {host}:{port}")
         mongo = MongoClient(host=host, port=port)
         self._db = mongo[name]
-        db_info = self._db.meta.find({"meta": "info"})
-        if db_info.count():
-            log.info(f"Database created {db_info[0]['created']}")
+        db_info = self._db.meta.find_one({"meta": "info"})
+        if db_info:
+            log.info(f"Database created {db_info['created']}")
+            if db_info["version"] != DB_VERSION:
+                self.upgrade(db_info["version"])
         else:
             log.warn("Creating new database")
             self._db.meta.insert_one(
@@ -56,179 +151,257 @@ class BotDatabase:
                 }
             }
         )
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._servers = AsyncCollection(self, self._db.servers)
+        self._commands = AsyncCollection(self, self._db.commands)
+        self._roles = AsyncCollection(self, self._db.roles)
+        self._events = AsyncCollection(self, self._db.events)
+        self._users = AsyncCollection(self, self._db.users)
+        self._audit = AsyncCollection(self, self._db.audit)
+        self.audit = AuditWriter(self._audit, audit_size, audit_interval)
+        self.prefixes = cache.LRUCache(cache_size)
+        self.permissions = cache.LRUCache(cache_size)
+        self.server_commands = cache.LRUCache(cache_size)
+        self.prefix_starts = {DEFAULT_PREFIX[0]}
+
+    def upgrade(self, version):
+        log.warn(f"Upgrading database from {version} to {DB_VERSION}")
+        if version == "0.1":
+            for server in self._db.servers.find({"log": {"$exists": True}}, {"id": True, "log": True}):
+                entries = []
+                for entry in server["log"]:
+                    if "server" in entry:
+                        entry["target"] = entry.pop("server")
+                    entry["server"] = server["id"]
+                    entries.append(entry)
+                if entries:
+                    self._db.audit.insert_many(entries)
+            self._db.servers.update_many({}, {"$unset": {"log": ""}})
+        self._db.meta.update_one({"meta": "info"}, {"$set": {"version": DB_VERSION}})
+        self._db.meta.update_one(
+            {"meta": "log"}, {
+                "$push": {
+                    "updated": [version, DB_VERSION, datetime.utcnow()]
+                }
+            }
+        )
+
+    async def close(self):
+        await self.audit.flush()
+
+    async def run(self, function, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(self._pool, partial(function, *args, **kwargs))
+
+    async def ensure_indexes(self):
+        declared = {}
+        for collection, keys, options in INDEXES:
+            if not collection in declared:
+                declared[collection] = {"_id_"}
+            existing = await AsyncCollection(self, self._db[collection]).index_information()
+            try:
+                name = await AsyncCollection(self, self._db[collection]).create_index(keys, **options)
+            except OperationFailure:
+                log.exception(f"Could not create index {keys} on {collection}")
+                continue
+            declared[collection].add(name)
+            if not name in existing:
+                log.info(f"Created index {name} on {collection}")
+        await self.report_indexes(declared)
+
+    async def report_indexes(self, declared):
+        for collection in declared:
+            try:
+                stats = await AsyncCollection(self, self._db[collection]).aggregate([{"$indexStats": {}}])
+            except OperationFailure:
+                log.warn(f"Could not read index usage for {collection}")
+                continue
+            for index in stats:
+                if not index["name"] in declared[collection]:
+                    log.warn(f"Index {index['name']} on {collection} is not declared by {__name__}")
+                elif index["accesses"]["ops"] == 0:
+                    log.info(f"Index {index['name']} on {collection} has not been used since {index['accesses']['since']}")
 
     async def check_exists(self, collection, *args):
-        db_query = self._db[collection].find(*args)
-        return db_query.count()
+        return await AsyncCollection(self, self._db[collection]).find_one(*args) is not None
 
 
     # Servers
 
     async def server_join(self, server_id):
-        if not await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.insert_one(
-                {
-                    "id": server_id,
-                    "log": [],
-                    "enabled": True,
-                    "member": True,
-                    "joinable": True,
-                    "banned": False,
-                    "prefix": '!'
-                }
+        try:
+            server = await self._servers.find_one_and_update(
+                {"id": server_id}, {
+                    "$setOnInsert": {
+                        "joinable": True,
+                        "banned": False,
+                        "prefix": DEFAULT_PREFIX
+                    },
+                    "$set": {
+                        "enabled": True,
+                        "member": True
+                    }
+                },
+                projection={"prefix": True},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
             )
-        self._db.servers.update_one(
+        except DuplicateKeyError:
+            return await self.server_join(server_id)
+        self.cache_prefix(server_id, server["prefix"])
+        await self.audit_add(server_id, {
+            "event": "join"
+        })
+        return True
+
+    async def server_leave(self, server_id):
+        result = await self._servers.update_one(
             {"id": server_id}, {
                 "$set": {
-                    "enabled": True,
-                    "member": True
-                },
-                "$addToSet": {
-                    "log": {
-                        "event": "join",
-                        "time": datetime.utcnow()
-                    }
+                    "enabled": False,
+                    "member": False
                 }
             }
         )
-        return True
-
-    async def server_leave(self, server_id):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "enabled": False,
-                        "member": False
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "leave",
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
-            )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "leave"
+            })
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
 
     async def server_get(self, server_id, attribute):
-        if await self.check_exists("servers", {"id": server_id}):
-            server = self._db.servers.find({"id": server_id})
-            return server[0][attribute], None
+        server = await self._servers.find_one({"id": server_id}, {attribute: True})
+        if server:
+            return server.get(attribute), None
         else:
             return False, lang.SRV_NOT_FOUND
 
+    def cache_prefix(self, server_id, prefix):
+        self.prefixes.set(server_id, prefix)
+        if prefix:
+            self.prefix_starts.add(prefix[0])
+
+    def prefix_known(self, content):
+        return content[:1] in self.prefix_starts
+
+    async def server_load_prefixes(self, server_ids):
+        generation = self.prefixes.generation
+        for server in await self._servers.find({"id": {"$in": server_ids}}, {"id": True, "prefix": True}):
+            self.prefixes.fill(server["id"], server["prefix"], generation)
+            if server["prefix"]:
+                self.prefix_starts.add(server["prefix"][0])
+
+    async def server_get_prefix(self, server_id):
+        prefix = self.prefixes.get(server_id)
+        if prefix is None:
+            generation = self.prefixes.generation
+            prefix, error = await self.server_get(server_id, "prefix")
+            if error:
+                return prefix, error
+            self.prefixes.fill(server_id, prefix, generation)
+            if prefix:
+                self.prefix_starts.add(prefix[0])
+        return prefix, None
+
     async def server_get_ids(self, query):
         ids = []
-        for server in self._db.servers.find(query):
+        for server in await self._servers.find(query):
             ids.append(server["id"])
         return ids
 
     async def server_enable(self, server_id, enable=True, by=None, reason=None):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "enabled": enable
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "enable" if enable else "disable",
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._servers.update_one(
+            {"id": server_id}, {
+                "$set": {
+                    "enabled": enable
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "enable" if enable else "disable",
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
 
     async def server_member(self, server_id, member=True, by=None, reason=None):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "member": member
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "is_member" if member else "not_member",
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._servers.update_one(
+            {"id": server_id}, {
+                "$set": {
+                    "member": member
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "is_member" if member else "not_member",
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
 
     async def server_joinable(self, server_id, joinable=True, by=None, reason=None):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "joinable": joinable
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "joinable" if joinable else "unjoinable",
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._servers.update_one(
+            {"id": server_id}, {
+                "$set": {
+                    "joinable": joinable
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "joinable" if joinable else "unjoinable",
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
 
     async def server_ban(self, server_id, ban=True, by=None, reason=None):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "banned": ban
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "ban" if ban else "unban",
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._servers.update_one(
+            {"id": server_id}, {
+                "$set": {
+                    "banned": ban
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "ban" if ban else "unban",
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
 
     async def server_set_prefix(self, server_id, new_prefix, by=None, reason=None):
-        if await self.check_exists("servers", {"id": server_id}):
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$set": {
-                        "prefix": new_prefix
-                    },
-                    "$addToSet": {
-                        "log": {
-                            "event": "update_prefix",
-                            "old": await self.server_get(server_id, "prefix"),
-                            "new": new_prefix,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        server = await self._servers.find_one_and_update(
+            {"id": server_id}, {
+                "$set": {
+                    "prefix": new_prefix
                 }
-            )
+            },
+            projection={"prefix": True},
+            return_document=ReturnDocument.BEFORE
+        )
+        if server:
+            await self.audit_add(server_id, {
+                "event": "update_prefix",
+                "old": server.get("prefix"),
+                "new": new_prefix,
+                "by": by,
+                "reason": reason
+            })
+            self.prefixes.invalidate()
+            self.cache_prefix(server_id, new_prefix)
             return True, None
         else:
             return False, lang.SRV_NOT_FOUND
@@ -237,784 +410,648 @@ class BotDatabase:
     # Commands
 
     async def command_add(self, server_id, public, available_for, enable_all, enabled_for, name, use_permissions, permissions, use_roles, roles, action, by=None, reason=None, **kwargs):
-        if not await self.check_exists("commands", {"owner": server_id, "name": name}):
-            document = {
-                "owner": server_id,
-                "public": public,
-                "available": available_for,
-                "enable_all": enable_all,
-                "enabled": enabled_for,
-                "name": name,
-                "use_permissions": use_permissions,
-                "permissions": permissions,
-                "use_roles": use_roles,
-                "roles": roles,
-                "action": action,
-            }
-            document.update(kwargs)
-            self._db.commands.insert_one(document)
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_create",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
+        document = {
+            "public": public,
+            "available": available_for,
+            "enable_all": enable_all,
+            "enabled": enabled_for,
+            "use_permissions": use_permissions,
+            "permissions": permissions,
+            "use_roles": use_roles,
+            "roles": roles,
+            "action": action,
+        }
+        document.update(kwargs)
+        try:
+            result = await self._commands.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$setOnInsert": document
+                },
+                upsert=True
             )
+        except DuplicateKeyError:
+            return False, lang.CMD_EXISTS
+        if result.upserted_id is not None:
+            await self.audit_add(server_id, {
+                "event": "command_create",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_EXISTS
 
     async def command_remove(self, server_id, name, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.delete_one({"owner": server_id, "name": name})
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_delete",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
-            )
+        result = await self._commands.delete_one({"owner": server_id, "name": name})
+        if result.deleted_count:
+            await self.audit_add(server_id, {
+                "event": "command_delete",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_find(self, name, server_id=None):
         if server_id:
-            return self._db.commands.find({"name": name, "enabled": server_id})
+            commands = self.server_commands.get(server_id)
+            if commands is None:
+                generation = self.server_commands.generation
+                commands = {}
+                for command in await self._commands.find({"enabled": server_id}):
+                    if not command["name"] in commands:
+                        commands[command["name"]] = []
+                    commands[command["name"]].append(command)
+                self.server_commands.fill(server_id, commands, generation)
+            return commands.get(name, [])
+        else:
+            return await self._commands.find({"name": name})
+
+    def commands_invalidate(self, server_id=None):
+        if server_id:
+            self.server_commands.remove(server_id)
         else:
-            return self._db.commands.find({"name": name})
+            self.server_commands.clear()
 
     async def command_public(self, server_id, name, public=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.update_one(
-                {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "public": public
-                    }
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_public" if enable else "command_private",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._commands.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "public": public
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "command_public" if public else "command_private",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_available(self, server_id, name, available_for, available=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            if available:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$addToSet": {
-                            "available": available_for,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_available_for_server",
-                                "command": name,
-                                "server": available_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
-                    }
-                )
-                return True, None
-            else:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$pull": {
-                            "available": available_for
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_unavailable_for_server",
-                                "command": name,
-                                "server": available_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if available:
+            result = await self._commands.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$addToSet": {
+                        "available": available_for,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_available_for_server",
+                    "command": name,
+                    "target": available_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate()
                 return True, None
         else:
-            return False, lang.CMD_NOT_FOUND
-
-    async def command_enable_all(self, server_id, name, enable_all=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.update_one(
+            result = await self._commands.update_one(
                 {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "enable_all": enable_all
+                    "$pull": {
+                        "available": available_for
                     }
                 }
             )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_enable_all" if enable else "command_unenable_all",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_unavailable_for_server",
+                    "command": name,
+                    "target": available_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate()
+                return True, None
+        return False, lang.CMD_NOT_FOUND
+
+    async def command_enable_all(self, server_id, name, enable_all=True, by=None, reason=None):
+        result = await self._commands.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "enable_all": enable_all
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "command_enable_all" if enable_all else "command_unenable_all",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_enable(self, server_id, name, enable_for, enable=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            if enable:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$addToSet": {
-                            "enabled": enable_for,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_enable_for_server",
-                                "command": name,
-                                "server": enable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
-                    }
-                )
-                return True, None
-            else:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$pull": {
-                            "enabled": enable_for
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_disable_for_server",
-                                "command": name,
-                                "server": enable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if enable:
+            result = await self._commands.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$addToSet": {
+                        "enabled": enable_for,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_enable_for_server",
+                    "command": name,
+                    "target": enable_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate(enable_for)
                 return True, None
         else:
-            return False, lang.CMD_NOT_FOUND
-
-    async def command_use_permissions(self, server_id, name, use_permissions=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.update_one(
+            result = await self._commands.update_one(
                 {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "use_permissions": use_permissions
+                    "$pull": {
+                        "enabled": enable_for
                     }
                 }
             )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_use_permissions" if enable else "command_disable_permissions",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_disable_for_server",
+                    "command": name,
+                    "target": enable_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate(enable_for)
+                return True, None
+        return False, lang.CMD_NOT_FOUND
+
+    async def command_use_permissions(self, server_id, name, use_permissions=True, by=None, reason=None):
+        result = await self._commands.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "use_permissions": use_permissions
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "command_use_permissions" if use_permissions else "command_disable_permissions",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_set_permissions(self, server_id, name, permissions, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.update_one(
-                {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "permissions": permissions
-                    }
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_set_permissions",
-                            "command": name,
-                            "permissions": permissions,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._commands.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "permissions": permissions
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "command_set_permissions",
+                "command": name,
+                "permissions": permissions,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_use_roles(self, server_id, name, use_roles=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            self._db.commands.update_one(
-                {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "use_roles": use_roles
-                    }
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "command_use_roles" if enable else "command_disable_roles",
-                            "command": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._commands.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "use_roles": use_roles
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "command_use_roles" if use_roles else "command_disable_roles",
+                "command": name,
+                "by": by,
+                "reason": reason
+            })
+            self.commands_invalidate()
             return True, None
         else:
             return False, lang.CMD_NOT_FOUND
 
     async def command_role(self, server_id, name, role, add=True, by=None, reason=None):
-        if await self.check_exists("commands", {"owner": server_id, "name": name}):
-            if add:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$addToSet": {
-                            "roles": role,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_add_role",
-                                "command": name,
-                                "role": role,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if add:
+            result = await self._commands.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$addToSet": {
+                        "roles": role,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_add_role",
+                    "command": name,
+                    "role": role,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate()
                 return True, None
-            else:
-                self._db.commands.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$pull": {
-                            "roles": roll
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "command_remove_role",
-                                "command": name,
-                                "role": role,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        else:
+            result = await self._commands.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$pull": {
+                        "roles": role
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "command_remove_role",
+                    "command": name,
+                    "role": role,
+                    "by": by,
+                    "reason": reason
+                })
+                self.commands_invalidate()
                 return True, None
-        else:
-            return False, lang.CMD_NOT_FOUND
+        return False, lang.CMD_NOT_FOUND
 
 
     # Roles
 
     async def role_add(self, server_id, role_id, children, permission, is_open, joinable_by, by=None, reason=None):
-        if not await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            self._db.roles.insert_one(
-                {
-                    "owner": server_id,
-                    "id": role_id,
-                    "children": children,
-                    "permission": permission,
-                    "open": is_open,
-                    "joinable": joinable_by
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "role_create",
-                            "role": role_id,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
+        try:
+            result = await self._roles.update_one(
+                {"owner": server_id, "id": role_id}, {
+                    "$setOnInsert": {
+                        "children": children,
+                        "permission": permission,
+                        "open": is_open,
+                        "joinable": joinable_by
                     }
-                }
+                },
+                upsert=True
             )
+        except DuplicateKeyError:
+            return False, lang.ROLE_EXISTS
+        if result.upserted_id is not None:
+            await self.audit_add(server_id, {
+                "event": "role_create",
+                "role": role_id,
+                "by": by,
+                "reason": reason
+            })
+            self.permissions_invalidate(server_id)
             return True, None
         else:
             return False, lang.ROLE_EXISTS
 
     async def role_remove(self, server_id, role_id, by=None, reason=None):
-        if await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            self._db.roles.delete_one({"owner": server_id, "id": role_id})
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "role_delete",
-                            "role": role_id,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
-            )
+        result = await self._roles.delete_one({"owner": server_id, "id": role_id})
+        if result.deleted_count:
+            await self.audit_add(server_id, {
+                "event": "role_delete",
+                "role": role_id,
+                "by": by,
+                "reason": reason
+            })
+            self.permissions_invalidate(server_id)
             return True, None
         else:
             return False, lang.ROLE_NOT_FOUND
 
     async def role_find(self, role_id):
-        return self._db.roles.find({"id": role_id})
+        return await self._roles.find({"id": role_id})
 
     async def role_child(self, server_id, role_id, child_id, add=True, by=None, reason=None):
-        if await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            if add:
-                self._db.roles.update_one(
-                    {"owner": server_id, "id": role_id}, {
-                        "$addToSet": {
-                            "children": role_id,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "role_add_child",
-                                "role": role_id,
-                                "child": child_id,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
-                    }
-                )
-                return True, None
-            else:
-                self._db.roles.update_one(
-                    {"owner": server_id, "id": role_id}, {
-                        "$pull": {
-                            "children": child_id
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "role_remove_child",
-                                "role": role_id,
-                                "child": child_id,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if add:
+            result = await self._roles.update_one(
+                {"owner": server_id, "id": role_id}, {
+                    "$addToSet": {
+                        "children": child_id,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "role_add_child",
+                    "role": role_id,
+                    "child": child_id,
+                    "by": by,
+                    "reason": reason
+                })
+                self.permissions_invalidate(server_id)
                 return True, None
         else:
-            return False, lang.ROLE_NOT_FOUND
-
-    async def role_set_permission(self, server_id, role_id, permission, by=None, reason=None):
-        if await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            self._db.roles.update_one(
+            result = await self._roles.update_one(
                 {"owner": server_id, "id": role_id}, {
-                    "$set": {
-                        "permission": permission
+                    "$pull": {
+                        "children": child_id
                     }
                 }
             )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "role_set_permission",
-                            "role": role_id,
-                            "permission": permission,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "role_remove_child",
+                    "role": role_id,
+                    "child": child_id,
+                    "by": by,
+                    "reason": reason
+                })
+                self.permissions_invalidate(server_id)
+                return True, None
+        return False, lang.ROLE_NOT_FOUND
+
+    async def role_set_permission(self, server_id, role_id, permission, by=None, reason=None):
+        result = await self._roles.update_one(
+            {"owner": server_id, "id": role_id}, {
+                "$set": {
+                    "permission": permission
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "role_set_permission",
+                "role": role_id,
+                "permission": permission,
+                "by": by,
+                "reason": reason
+            })
+            self.permissions_invalidate(server_id)
             return True, None
         else:
             return False, lang.ROLE_NOT_FOUND
 
     async def role_open(self, server_id, role_id, is_open=True, by=None, reason=None):
-        if await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            self._db.roles.update_one(
-                {"owner": server_id, "id": role_id}, {
-                    "$set": {
-                        "open": is_open
-                    }
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "role_open" if is_open else "role_close",
-                            "role": role_id,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._roles.update_one(
+            {"owner": server_id, "id": role_id}, {
+                "$set": {
+                    "open": is_open
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "role_open" if is_open else "role_close",
+                "role": role_id,
+                "by": by,
+                "reason": reason
+            })
+            self.permissions_invalidate(server_id)
             return True, None
         else:
             return False, lang.ROLE_NOT_FOUND
 
     async def role_joinable(self, server_id, role_id, joinable_for, joinable=True, by=None, reason=None):
-        if await self.check_exists("roles", {"owner": server_id, "id": role_id}):
-            if joinable:
-                self._db.roles.update_one(
-                    {"owner": server_id, "id": role_id}, {
-                        "$addToSet": {
-                            "joinable": joinable_for,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "role_joinable",
-                                "role": role_id,
-                                "joinable_by": joinable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if joinable:
+            result = await self._roles.update_one(
+                {"owner": server_id, "id": role_id}, {
+                    "$addToSet": {
+                        "joinable": joinable_for,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "role_joinable",
+                    "role": role_id,
+                    "joinable_by": joinable_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.permissions_invalidate(server_id)
                 return True, None
-            else:
-                self._db.roles.update_one(
-                    {"owner": server_id, "id": role_id}, {
-                        "$pull": {
-                            "joinable": joinable_for
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "role_unjoinable",
-                                "role": role_id,
-                                "unjoinable_by": joinable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        else:
+            result = await self._roles.update_one(
+                {"owner": server_id, "id": role_id}, {
+                    "$pull": {
+                        "joinable": joinable_for
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "role_unjoinable",
+                    "role": role_id,
+                    "unjoinable_by": joinable_for,
+                    "by": by,
+                    "reason": reason
+                })
+                self.permissions_invalidate(server_id)
                 return True, None
-        else:
-            return False, lang.ROLE_NOT_FOUND
+        return False, lang.ROLE_NOT_FOUND
 
 
     # Events
 
     async def event_add(self, server_id, public, available_for, enable_all, enabled_for, name, event, action, by=None, reason=None, **kwargs):
-        if not await self.check_exists("events", {"owner": server_id, "name": name}):
-            document = {
-                "owner": server_id,
-                "public": public,
-                "available": available_for,
-                "enable_all": enable_all,
-                "enabled": enabled_for,
-                "name": name,
-                "event": event,
-                "action": action
-            }
-            document.update(kwargs)
-            self._db.events.insert_one(document)
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "event_create",
-                            "event_name": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
+        document = {
+            "public": public,
+            "available": available_for,
+            "enable_all": enable_all,
+            "enabled": enabled_for,
+            "event": event,
+            "action": action
+        }
+        document.update(kwargs)
+        try:
+            result = await self._events.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$setOnInsert": document
+                },
+                upsert=True
             )
+        except DuplicateKeyError:
+            return False, lang.EVENT_EXISTS
+        if result.upserted_id is not None:
+            await self.audit_add(server_id, {
+                "event": "event_create",
+                "event_name": name,
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.EVENT_EXISTS
 
     async def event_remove(self, server_id, name, by=None, reason=None):
-        if await self.check_exists("events", {"owner": server_id, "name": name}):
-            self._db.events.delete_one({"owner": server_id, "name": name})
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "event_delete",
-                            "event_name": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
-                }
-            )
+        result = await self._events.delete_one({"owner": server_id, "name": name})
+        if result.deleted_count:
+            await self.audit_add(server_id, {
+                "event": "event_delete",
+                "event_name": name,
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.EVENT_NOT_FOUND
 
     async def event_find(self, name, server_id=None):
         if server_id:
-            return self._db.events.find({"name": name, "enabled": server_id})
+            return await self._events.find({"name": name, "enabled": server_id})
         else:
-            return self._db.events.find({"name": name})
+            return await self._events.find({"name": name})
 
     async def event_get(self, event, server_id=None):
         if server_id:
-            return self._db.events.find({"event": event, "enabled": server_id})
+            return await self._events.find({"event": event, "enabled": server_id})
         else:
-            return self._db.events.find({"event": event})
+            return await self._events.find({"event": event})
 
     async def event_public(self, server_id, name, public=True, by=None, reason=None):
-        if await self.check_exists("events", {"owner": server_id, "name": name}):
-            self._db.events.update_one(
-                {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "public": public
-                    }
-                }
-            )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "event_public" if enable else "event_private",
-                            "event_name": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+        result = await self._events.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "public": public
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "event_public" if public else "event_private",
+                "event_name": name,
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.EVENT_NOT_FOUND
 
     async def event_available(self, server_id, name, available_for, available=True, by=None, reason=None):
-        if await self.check_exists("events", {"owner": server_id, "name": name}):
-            if available:
-                self._db.events.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$addToSet": {
-                            "available": available_for,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "event_available_for_server",
-                                "event_name": name,
-                                "server": available_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
-                    }
-                )
-                return True, None
-            else:
-                self._db.events.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$pull": {
-                            "available": available_for
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "event_unavailable_for_server",
-                                "event_name": name,
-                                "server": available_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if available:
+            result = await self._events.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$addToSet": {
+                        "available": available_for,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "event_available_for_server",
+                    "event_name": name,
+                    "target": available_for,
+                    "by": by,
+                    "reason": reason
+                })
                 return True, None
         else:
-            return False, lang.EVENT_NOT_FOUND
-
-    async def event_enable_all(self, server_id, name, enable_all=True, by=None, reason=None):
-        if await self.check_exists("events", {"owner": server_id, "name": name}):
-            self._db.events.update_one(
+            result = await self._events.update_one(
                 {"owner": server_id, "name": name}, {
-                    "$set": {
-                        "enable_all": enable_all
+                    "$pull": {
+                        "available": available_for
                     }
                 }
             )
-            self._db.servers.update_one(
-                {"id": server_id}, {
-                    "$addToSet": {
-                        "log": {
-                            "event": "event_enable_all" if enable else "event_unenable_all",
-                            "event_name": name,
-                            "by": by,
-                            "reason": reason,
-                            "time": datetime.utcnow()
-                        }
-                    }
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "event_unavailable_for_server",
+                    "event_name": name,
+                    "target": available_for,
+                    "by": by,
+                    "reason": reason
+                })
+                return True, None
+        return False, lang.EVENT_NOT_FOUND
+
+    async def event_enable_all(self, server_id, name, enable_all=True, by=None, reason=None):
+        result = await self._events.update_one(
+            {"owner": server_id, "name": name}, {
+                "$set": {
+                    "enable_all": enable_all
                 }
-            )
+            }
+        )
+        if result.matched_count:
+            await self.audit_add(server_id, {
+                "event": "event_enable_all" if enable_all else "event_unenable_all",
+                "event_name": name,
+                "by": by,
+                "reason": reason
+            })
             return True, None
         else:
             return False, lang.EVENT_NOT_FOUND
 
     async def event_enable(self, server_id, name, enable_for, enable=True, by=None, reason=None):
-        if await self.check_exists("events", {"owner": server_id, "name": name}):
-            if enable:
-                self._db.events.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$addToSet": {
-                            "enabled": enable_for,
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "event_enable_for_server",
-                                "event_name": name,
-                                "server": enable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        if enable:
+            result = await self._events.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$addToSet": {
+                        "enabled": enable_for,
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "event_enable_for_server",
+                    "event_name": name,
+                    "target": enable_for,
+                    "by": by,
+                    "reason": reason
+                })
                 return True, None
-            else:
-                self._db.events.update_one(
-                    {"owner": server_id, "name": name}, {
-                        "$pull": {
-                            "enabled": enable_for
-                        }
-                    }
-                )
-                self._db.servers.update_one(
-                    {"id": server_id}, {
-                        "$addToSet": {
-                            "log": {
-                                "event": "event_disable_for_server",
-                                "event_name": name,
-                                "server": enable_for,
-                                "by": by,
-                                "reason": reason,
-                                "time": datetime.utcnow()
-                            }
-                        }
+        else:
+            result = await self._events.update_one(
+                {"owner": server_id, "name": name}, {
+                    "$pull": {
+                        "enabled": enable_for
                     }
-                )
+                }
+            )
+            if result.matched_count:
+                await self.audit_add(server_id, {
+                    "event": "event_disable_for_server",
+                    "event_name": name,
+                    "target": enable_for,
+                    "by": by,
+                    "reason": reason
+                })
                 return True, None
-        else:
-            return False, lang.EVENT_NOT_FOUND
+        return False, lang.EVENT_NOT_FOUND
+
+
+    # Audit
+
+    async def audit_add(self, server_id, entry):
+        entry["server"] = server_id
+        entry["time"] = datetime.utcnow()
+        self.audit.add(entry)
+
+    async def audit_find(self, server_id, before=None, limit=AUDIT_PAGE):
+        await self.audit.flush()
+        query = {"server": server_id}
+        if before:
+            query["time"] = {"$lt": before}
+        return await self._audit.find(query, {"_id": False}, sort=[("time", DESCENDING)], limit=limit)
 
 
     # Users
 
     async def user_find(self, query):
-        return self._db.users.find(query)
+        return await self._users.find(query)
 
     async def user_find_ids(self, query):
         ids = []
@@ -1025,13 +1062,56 @@ class BotDatabase:
 
     # General
 
-    async def get_user_permissions(self, user_id, role_ids):
+    async def get_user_permissions(self, user_id, role_ids, server_id=None):
+        if server_id:
+            permissions = self.permissions.get((server_id, user_id))
+            if permissions:
+                return list(permissions)
+        generation = self.permissions.generation
         highest_permission = 0
-        for role_id in role_ids:
-            for role in await self.role_find(role_id):
-                if role["permission"] > highest_permission:
-                    highest_permission = role["permission"]
+        if role_ids:
+            for result in await self._roles.aggregate([
+                {"$match": {"id": {"$in": list(role_ids)}}},
+                {"$group": {"_id": None, "permission": {"$max": "$permission"}}}
+            ]):
+                highest_permission = max(highest_permission, result["permission"] or 0)
         is_superuser = False
-        for user in await self.user_find({"id": user_id}):
+        user = await self._users.find_one({"id": user_id}, {"superuser": True})
+        if user:
             is_superuser = user["superuser"]
+        if server_id:
+            self.permissions.fill((server_id, user_id), (highest_permission, is_superuser), generation)
         return [highest_permission, is_superuser]
+
+    async def get_members_permissions(self, members, server_id=None):
+        generation = self.permissions.generation
+        role_ids = set()
+        for user_id in members:
+            role_ids.update(members[user_id])
+        role_permissions = {}
+        if role_ids:
+            for role in await self._roles.find({"id": {"$in": list(role_ids)}}, {"id": True, "permission": True}):
+                role_permissions[role["id"]] = max(role_permissions.get(role["id"], 0), role["permission"])
+        superusers = {}
+        for user in await self._users.find({"id": {"$in": list(members)}}, {"id": True, "superuser": True}):
+            superusers[user["id"]] = user["superuser"]
+
+        permissions = {}
+        for user_id in members:
+            highest_permission = 0
+            for role_id in members[user_id]:
+                highest_permission = max(highest_permission, role_permissions.get(role_id, 0))
+            is_superuser = superusers.get(user_id, False)
+            if server_id:
+                self.permissions.fill((server_id, user_id), (highest_permission, is_superuser), generation)
+            permissions[user_id] = [highest_permission, is_superuser]
+        return permissions
+
+    def permissions_invalidate(self, server_id=None, user_id=None):
+        self.permissions.invalidate()
+        if server_id and user_id:
+            self.permissions.remove((server_id, user_id))
+            return
+        for key in self.permissions.keys():
+            if (not server_id or key[0] == server_id) and (not user_id or key[1] == user_id):
+                self.permissions.remove(key)
@@ -0,0 +1,148 @@
+###############################################################################
+#   TransportLayerBot: Executor - All-in-one modular bot for Discord          #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from TLLogger import logger
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from tlbot import lang
+from tlbot import feed
+
+log = logger.get_logger(__name__)
+
+POOLS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
+# Unlike the feed records, these keep everything an offloaded function may need to parse
+def _message(message):
+    return {
+        "message": message.id,
+        "channel": message.channel.id,
+        "server": feed._server_id(message),
+        "author": message.author.id,
+        "content": message.content,
+        "attachments": [attachment["url"] for attachment in message.attachments],
+        "mentions": [user.id for user in message.mentions],
+        "timestamp": message.timestamp.isoformat()
+    }
+
+def _reaction(reaction, user):
+    record = _message(reaction.message)
+    record["user"] = user.id
+    record["emoji"] = str(reaction.emoji)
+    return record
+
+def _member(member):
+    return {
+        "user": member.id,
+        "server": feed._server_id(member),
+        "name": str(member),
+        "roles": [role.id for role in getattr(member, "roles", ())]
+    }
+
+def _role(role):
+    return {
+        "role": role.id,
+        "server": feed._server_id(role),
+        "name": role.name,
+        "permissions": role.permissions.value
+    }
+
+RECORDS = {
+    "on_message_delete": _message,
+    "on_message_edit": lambda before, after: _message(after),
+    "on_reaction_add": _reaction,
+    "on_reaction_remove": _reaction,
+    "on_member_join": _member,
+    "on_member_remove": _member,
+    "on_member_update": lambda before, after: _member(after),
+    "on_member_ban": _member,
+    "on_server_join": feed._server,
+    "on_server_remove": feed._server,
+    "on_server_role_create": _role,
+    "on_server_role_delete": _role,
+    "on_server_role_update": lambda before, after: _role(after),
+    "on_channel_create": feed._channel,
+    "on_channel_delete": feed._channel,
+    "on_channel_update": lambda before, after: feed._channel(after)
+}
+
+def get_record(event, args):
+    if event in RECORDS:
+        return RECORDS[event](*args)
+    elif event.startswith("on_message") and args:
+        return _message(args[0])
+    return {}
+
+class Executor:
+    def __init__(self, transportlayerbot, threads=4, processes=2, queue_limit=100):
+        self.transportlayerbot = transportlayerbot
+        self.sizes = {
+            "thread": threads,
+            "process": processes
+        }
+        self.queue_limit = queue_limit
+        self.pools = {}
+        self.pending = {}
+        for mode in POOLS:
+            self.pending[mode] = 0
+
+    def get_pool(self, mode):
+        if not mode in self.pools:
+            self.pools[mode] = POOLS[mode](max_workers=self.sizes[mode])
+        return self.pools[mode]
+
+    def available(self, mode):
+        return self.pending[mode] < self.queue_limit
+
+    async def run(self, mode, function, *args):
+        self.pending[mode] += 1
+        try:
+            return await self.transportlayerbot.loop.run_in_executor(self.get_pool(mode), partial(function, *args))
+        finally:
+            self.pending[mode] -= 1
+
+    async def run_command(self, command, message, args, permissions):
+        mode = command["executor"]
+        if not self.available(mode):
+            log.warn(f"Refusing to run {command['name']} ({mode} pool queue is full)")
+            await self.transportlayerbot.send_message(message.channel, lang.EXEC_BUSY)
+            return
+        result = await self.run(mode, command["function"], _message(message), args, list(permissions))
+        if result:
+            await self.transportlayerbot.send_message(message.channel, result)
+
+    def wrap_handler(self, mode, event, function):
+        async def _run(transportlayerbot, *args):
+            if not self.available(mode):
+                log.warn(f"Dropping {event} for {function.__name__} ({mode} pool queue is full)")
+                return
+            record = get_record(event, args)
+            result = await self.run(mode, function, record)
+            if result and record.get("channel"):
+                channel = transportlayerbot.get_channel(record["channel"])
+                if channel:
+                    await transportlayerbot.send_message(channel, result)
+        _run.__qualname__ = function.__qualname__
+        return _run
+
+    def shutdown(self):
+        for mode in self.pools:
+            self.pools[mode].shutdown(wait=False)
+        self.pools = {}
@@ -18,7 +18,9 @@
 
 from TLLogger import logger
 from os import makedirs, listdir
-from importlib import import_module
+from importlib import import_module, reload
+import sys
+from tlbot import executor
 
 log = logger.get_logger(__name__)
 
@@ -34,11 +36,17 @@ class Extender:
         self.modules  = []
 
     def load(self):
+        for module in self.modules:
+            self.transportlayerbot.remove_handlers(module.__name__)
         self.modules  = []
         for file in listdir("plugins"):
             if file.endswith(".py"):
                 try:
-                    self.modules.append(import_module(f"plugins.{file[:-3]}"))
+                    name = f"plugins.{file[:-3]}"
+                    if name in sys.modules:
+                        self.modules.append(reload(sys.modules[name]))
+                    else:
+                        self.modules.append(import_module(name))
                     if not hasattr(self.modules[-1], "TL_META"):
                         log.error(f"Refusing to import {file} (could not find valid metadata)")
                         del(self.modules[-1])
@@ -51,12 +59,29 @@ class Extender:
                     log.exception(f"Error while importing {file}")
                     log.error("You may need to provide the information above to the plugin author")
 
+        handler_keys = {"handlers", "priority_handlers", "concurrent_handlers"}
+        for mode in executor.POOLS:
+            handler_keys.add(f"{mode}_handlers")
         for module in self.modules:
+            for key in module.TL_META:
+                if key.endswith("_handlers") and not key in handler_keys:
+                    log.error(f"Ignoring {key} from {module.__name__} (unknown handler type)")
             if "handlers" in module.TL_META:
                 for handler in module.TL_META["handlers"]:
                     for function in module.TL_META["handlers"][handler]:
-                        self.transportlayerbot.loop.create_task(self.transportlayerbot.add_handler(module.__name__, handler, function))
+                        self.transportlayerbot.register_handler(module.__name__, handler, function)
             if "priority_handlers" in module.TL_META:
                 for handler in module.TL_META["priority_handlers"]:
                     for function in module.TL_META["priority_handlers"][handler]:
-                        self.transportlayerbot.loop.create_task(self.transportlayerbot.add_handler(module.__name__, handler, function, priority=True))
+                        self.transportlayerbot.register_handler(module.__name__, handler, function, priority=True)
+            if "concurrent_handlers" in module.TL_META:
+                concurrency = module.TL_META.get("concurrency", {})
+                self.transportlayerbot.set_handler_limits(module.__name__, concurrency.get("limit"), concurrency.get("timeout"))
+                for handler in module.TL_META["concurrent_handlers"]:
+                    for function in module.TL_META["concurrent_handlers"][handler]:
+                        self.transportlayerbot.register_handler(module.__name__, handler, function, concurrent=True)
+            for mode in executor.POOLS:
+                if f"{mode}_handlers" in module.TL_META:
+                    for handler in module.TL_META[f"{mode}_handlers"]:
+                        for function in module.TL_META[f"{mode}_handlers"][handler]:
+                            self.transportlayerbot.register_handler(module.__name__, handler, self.transportlayerbot.executor.wrap_handler(mode, handler, function))
@@ -0,0 +1,165 @@
+###############################################################################
+#   TransportLayerBot: Event Feed - All-in-one modular bot for Discord        #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from time import time
+from datetime import timezone
+
+CONTENT_LIMIT = 100
+
+def _server_id(thing):
+    server = getattr(thing, "server", None)
+    return server.id if server else None
+
+def _message(message):
+    return {
+        "message": message.id,
+        "channel": message.channel.id,
+        "server": _server_id(message),
+        "author": message.author.id,
+        "content": message.content[:CONTENT_LIMIT]
+    }
+
+def _reaction(reaction, user):
+    return {
+        "message": reaction.message.id,
+        "channel": reaction.message.channel.id,
+        "server": _server_id(reaction.message),
+        "user": user.id,
+        "emoji": str(reaction.emoji)
+    }
+
+def _channel(channel):
+    return {
+        "channel": channel.id,
+        "server": _server_id(channel),
+        "name": getattr(channel, "name", None)
+    }
+
+def _member(member):
+    return {
+        "user": member.id,
+        "server": _server_id(member),
+        "name": str(member)
+    }
+
+def _server(server):
+    return {
+        "server": server.id,
+        "name": server.name
+    }
+
+def _role(role):
+    return {
+        "role": role.id,
+        "server": _server_id(role),
+        "name": role.name
+    }
+
+def _channel_user(channel, user):
+    return {
+        "channel": channel.id,
+        "server": _server_id(channel),
+        "user": user.id
+    }
+
+# Flat record builders, records only hold ids, timestamps and short strings
+RECORDS = {
+    "on_ready": lambda: {},
+    "on_resumed": lambda: {},
+    "on_message": _message,
+    "on_message_delete": _message,
+    "on_message_edit": lambda before, after: _message(after),
+    "on_reaction_add": _reaction,
+    "on_reaction_remove": _reaction,
+    "on_reaction_clear": lambda message, reactions: {
+        "message": message.id,
+        "channel": message.channel.id,
+        "server": _server_id(message),
+        "count": len(reactions)
+    },
+    "on_channel_delete": _channel,
+    "on_channel_create": _channel,
+    "on_channel_update": lambda before, after: _channel(after),
+    "on_channel_pins_update": lambda channel, last_pin: {
+        "channel": channel.id,
+        "server": _server_id(channel),
+        "last_pin": last_pin.replace(tzinfo=timezone.utc).timestamp() if last_pin else None
+    },
+    "on_member_join": _member,
+    "on_member_remove": _member,
+    "on_member_update": lambda before, after: _member(after),
+    "on_server_join": _server,
+    "on_server_remove": _server,
+    "on_server_role_create": _role,
+    "on_server_role_delete": _role,
+    "on_server_role_update": lambda before, after: _role(after),
+    "on_server_emojis_update": lambda before, after: {
+        "server": _server_id((after or before)[0]) if after or before else None,
+        "count": len(after)
+    },
+    "on_server_available": _server,
+    "on_server_unavailable": _server,
+    "on_voice_state_update": lambda before, after: _member(after),
+    "on_member_ban": _member,
+    "on_member_unban": lambda server, user: {
+        "server": server.id,
+        "user": user.id
+    },
+    "on_typing": lambda channel, user, when: {
+        "channel": channel.id,
+        "server": _server_id(channel),
+        "user": user.id,
+        "when": when.replace(tzinfo=timezone.utc).timestamp()
+    },
+    "on_group_join": _channel_user,
+    "on_group_remove": _channel_user
+}
+
+class EventFeed:
+    def __init__(self, transportlayerbot, queue, events=(), tick=0.05):
+        self.transportlayerbot = transportlayerbot
+        self.queue = queue
+        self.tick = tick
+        self.subscriptions = set()
+        self.records = []
+        self.flush_handle = None
+        self.subscribe(*events)
+
+    def subscribe(self, *events):
+        for event in events:
+            if event in RECORDS:
+                self.subscriptions.add(event)
+
+    def unsubscribe(self, *events):
+        self.subscriptions.difference_update(events)
+
+    def publish(self, event, *args):
+        if not event in self.subscriptions:
+            return
+        record = RECORDS[event](*args)
+        record["event"] = event
+        record["time"] = time()
+        self.records.append(record)
+        if not self.flush_handle:
+            self.flush_handle = self.transportlayerbot.loop.call_later(self.tick, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        if self.records:
+            records, self.records = self.records, []
+            self.queue.put(records)
@@ -16,21 +16,33 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
 ###############################################################################
 
+from TLLogger import logger
 import multiprocessing
+import socket
 from tlbot import client
+from tlbot import channel
 import signal
 from os import kill
 from discord import utils
-from time import sleep
+from queue import Empty
 
-def client_thread(settings, pipe, queue):
-    transportlayerbot = client.TransportLayerBot(tl_settings=settings, tl_queue=queue)
+log = logger.get_logger(__name__)
 
-    def send_message(sig_num, stack):
-        message = pipe.recv()
-        channel = transportlayerbot.get_channel(message[0])
-        transportlayerbot.loop.create_task(transportlayerbot.send_message(channel, message[1]))
-    signal.signal(signal.SIGUSR1, send_message)
+BACKLOG_WARNING = 1000
+
+# Events forwarded from the client process
+FEED_EVENTS = (
+    "on_ready",
+    "on_resumed",
+    "on_server_join",
+    "on_server_remove",
+    "on_server_available",
+    "on_server_unavailable"
+)
+
+def client_thread(settings, sock, queue):
+    transportlayerbot = client.TransportLayerBot(tl_settings=settings, tl_queue=queue, tl_feed=FEED_EVENTS)
+    channel.ClientChannel(transportlayerbot, sock)
 
     try:
         transportlayerbot.loop.run_until_complete(transportlayerbot.start(settings["TOKEN"]))
@@ -39,24 +51,52 @@ def client_thread(settings, pipe, queue):
     finally:
         transportlayerbot.loop.close()
 
+def drain(queue, timeout=1):
+    try:
+        batches = [queue.get(timeout=timeout)]
+    except Empty:
+        return []
+    while True:
+        try:
+            batches.append(queue.get_nowait())
+        except Empty:
+            break
+    records = []
+    for batch in batches:
+        records.extend(batch)
+    return records
+
+def backlog(queue):
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return None
+
 def start(settings):
     queue = multiprocessing.Queue()
-    parent_pipe, child_pipe = multiprocessing.Pipe()
+    parent_sock, child_sock = socket.socketpair()
+    controller = channel.Controller(parent_sock)
 
-    thread = multiprocessing.Process(target=client_thread, args=(settings, child_pipe, queue,))
+    thread = multiprocessing.Process(target=client_thread, args=(settings, child_sock, queue,))
     thread.start()
+    child_sock.close()
 
     try:
         if settings["USE_INTERFACE"]:
             print("Interface not implemented")
-            while True:
-                if not queue.empty():
-                    queue.get(block=False)
-                sleep(0.05)
-        else:
-            while True:
-                if not queue.empty():
-                    queue.get(block=False)
-                sleep(0.05)
+        while thread.is_alive():
+            records = drain(queue)
+            if records:
+                size = backlog(queue)
+                log.debug(f"Received {len(records)} events ({size} batches waiting)")
+                if size and size > BACKLOG_WARNING:
+                    log.warn(f"Interface is falling behind ({size} batches waiting)")
+            controller.flush()
+            for reply in controller.poll():
+                log.debug(f"Control reply: {reply}")
     except KeyboardInterrupt:
-        kill(thread.pid, signal.SIGINT)
+        try:
+            controller.shutdown()
+            controller.flush()
+        except OSError:
+            kill(thread.pid, signal.SIGINT)
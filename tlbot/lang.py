@@ -33,6 +33,15 @@ ROLE_NOT_FOUND = "Role not found"
 EVENT_EXISTS = "Event already exists"
 EVENT_NOT_FOUND = "Event not found"
 
+# Arguments
+ARG_MISSING = "Missing argument {name}"
+ARG_INVALID = "Invalid value for {name}: {value}"
+ARG_TOO_MANY = "Too many arguments"
+ARG_USAGE = "{error}\nUsage: {name} {usage}"
+
+# Executor
+EXEC_BUSY = "Too busy right now, please try again later"
+
 # Templates
 MSG_IN = "{server} #{channel} {user} -> {message}"
 MSG_IN_DM = "DM: {user} -> {message}"
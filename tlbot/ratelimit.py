@@ -0,0 +1,71 @@
+###############################################################################
+#   TransportLayerBot: Rate Limiter - All-in-one modular bot for Discord      #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from time import monotonic
+from tlbot import cache
+
+SCOPES = ("user", "channel", "server", "command")
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, capacity, per, now):
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * capacity / per)
+        self.updated = now
+
+class RateLimiter:
+    def __init__(self, size=10000):
+        self.buckets = cache.LRUCache(size)
+
+    def get_key(self, scope, command, message):
+        if scope == "user":
+            return (scope, command["owner"], command["name"], message.author.id)
+        elif scope == "channel":
+            return (scope, command["owner"], command["name"], message.channel.id)
+        elif scope == "server":
+            return (scope, command["owner"], command["name"], message.server.id)
+        elif scope == "command":
+            return (scope, command["owner"], command["name"])
+        raise ValueError(f"Unknown rate limit scope {scope}")
+
+    def allow(self, command, message):
+        limits = command.get("rate_limits")
+        if not limits:
+            return True
+        now = monotonic()
+        buckets = []
+        for scope in limits:
+            capacity, per = limits[scope]
+            key = self.get_key(scope, command, message)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(capacity, now)
+                self.buckets.set(key, bucket)
+            else:
+                bucket.refill(capacity, per, now)
+            if bucket.tokens < 1:
+                return False
+            buckets.append(bucket)
+        # Only spend tokens once every bucket has allowed the call
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return True
@@ -0,0 +1,106 @@
+###############################################################################
+#   TransportLayerBot: Scheduler - All-in-one modular bot for Discord         #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from TLLogger import logger
+import asyncio
+from heapq import heappush, heappop
+from itertools import count
+from math import ceil
+
+log = logger.get_logger(__name__)
+
+class Job:
+    def __init__(self, when, function, args, kwargs, interval=None):
+        self.when = when
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    def __init__(self, transportlayerbot, tick=0.1):
+        self.transportlayerbot = transportlayerbot
+        self.tick = tick
+        self.jobs = []
+        self.sequence = count()
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def schedule(self, seconds, function, args=(), kwargs=None, interval=None):
+        job = Job(self.transportlayerbot.loop.time() + seconds, function, args, kwargs or {}, interval)
+        self.push(job)
+        return job
+
+    def push(self, job):
+        if not self.jobs or job.when < self.jobs[0][0]:
+            self.wake.set()
+        heappush(self.jobs, (job.when, next(self.sequence), job))
+        if not self.task:
+            self.task = self.transportlayerbot.loop.create_task(self.run())
+
+    def pending(self):
+        jobs = []
+        for when, _, job in sorted(self.jobs):
+            if not job.cancelled:
+                jobs.append(job)
+        return jobs
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        loop = self.transportlayerbot.loop
+        while True:
+            while self.jobs and self.jobs[0][2].cancelled:
+                heappop(self.jobs)
+            if not self.jobs:
+                await self.wake.wait()
+            else:
+                # Wake on tick boundaries so jobs due in the same tick share a wake-up
+                delay = ceil(self.jobs[0][0] / self.tick) * self.tick - loop.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            self.wake.clear()
+
+            now = loop.time()
+            while self.jobs and self.jobs[0][0] <= now:
+                job = heappop(self.jobs)[2]
+                if job.cancelled:
+                    continue
+                loop.create_task(self.run_job(job))
+                if job.interval:
+                    job.when += job.interval
+                    # Missed runs of a recurring job are coalesced into one
+                    if job.when <= now:
+                        job.when = now + job.interval
+                    heappush(self.jobs, (job.when, next(self.sequence), job))
+
+    async def run_job(self, job):
+        try:
+            await job.function(*job.args, **job.kwargs)
+        except Exception:
+            log.exception(f"Error in scheduled job {job.function.__name__}")
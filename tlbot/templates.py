@@ -0,0 +1,73 @@
+###############################################################################
+#   TransportLayerBot: Templates - All-in-one modular bot for Discord         #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+import re
+from tlbot import cache
+
+PLACEHOLDER = re.compile(r"\$(USER_NAME|USER_ID|USER|SERVER_ID|SERVER|CHANNEL_NAME|CHANNEL|ARGS|[1-9])")
+
+compiled = cache.LRUCache(1000)
+
+# Caller supplied text can't ping @everyone, @here, roles or users once @ is broken up
+def escape_mentions(text):
+    return text.replace("@", "@\u200b")
+
+def compile_template(text):
+    parts = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        if match.start() > position:
+            parts.append((False, text[position:match.start()]))
+        field = match.group(1)
+        parts.append((True, int(field) - 1 if field.isdigit() else field))
+        position = match.end()
+    if position < len(text):
+        parts.append((False, text[position:]))
+    return tuple(parts)
+
+def get_template(text):
+    template = compiled.get(text)
+    if template is None:
+        template = compile_template(text)
+        compiled.set(text, template)
+    return template
+
+def get_context(member, server=None, channel=None, args=()):
+    args = [escape_mentions(arg) for arg in args]
+    return {
+        "USER": member.mention,
+        "USER_NAME": escape_mentions(member.display_name if hasattr(member, "display_name") else member.name),
+        "USER_ID": member.id,
+        "SERVER": escape_mentions(server.name) if server else "",
+        "SERVER_ID": server.id if server else "",
+        "CHANNEL": channel.mention if channel and hasattr(channel, "mention") else "",
+        "CHANNEL_NAME": escape_mentions(getattr(channel, "name", None) or ""),
+        "ARGS": " ".join(args),
+        "args": args
+    }
+
+def render(text, context):
+    output = []
+    for is_field, value in get_template(text):
+        if not is_field:
+            output.append(value)
+        elif isinstance(value, int):
+            output.append(context["args"][value] if value < len(context["args"]) else "")
+        else:
+            output.append(context[value])
+    return "".join(output)
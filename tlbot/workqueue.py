@@ -0,0 +1,148 @@
+###############################################################################
+#   TransportLayerBot: Work Queue - All-in-one modular bot for Discord        #
+#   Copyright (C) 2017, 2018  TransportLayer                                  #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License, or      #
+#   (at your option) any later version.                                       #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.     #
+###############################################################################
+
+from TLLogger import logger
+import discord
+import asyncio
+from collections import deque
+
+log = logger.get_logger(__name__)
+
+# Events that may be shed when a server's queue is full, lowest rank first
+SHED_EVENTS = {
+    "on_typing": 0,
+    "on_reaction_add": 1,
+    "on_reaction_remove": 1,
+    "on_reaction_clear": 1,
+    "on_message_edit": 2,
+    "on_member_update": 2,
+    "on_voice_state_update": 2,
+    "on_channel_pins_update": 2
+}
+
+def get_server_id(args):
+    for arg in args:
+        if isinstance(arg, discord.Server):
+            return arg.id
+        server = getattr(arg, "server", None)
+        if server is None and hasattr(arg, "message"):
+            server = getattr(arg.message, "server", None)
+        if server is not None:
+            return server.id
+    return None
+
+class WorkQueue:
+    def __init__(self, transportlayerbot, workers=4, size=100, hold=5):
+        self.transportlayerbot = transportlayerbot
+        self.size = size
+        self.hold = hold
+        self.shed_events = dict(SHED_EVENTS)
+        self.queues = {}
+        self.ready = deque()
+        self.wake = asyncio.Event()
+        self.dropped = {}
+        self.running = set()
+        self.workers = []
+        for _ in range(workers):
+            self.workers.append(self.transportlayerbot.loop.create_task(self.work()))
+
+    def submit(self, server_id, event, args):
+        if not server_id in self.queues:
+            self.queues[server_id] = deque()
+            self.ready.append(server_id)
+            self.wake.set()
+        queue = self.queues[server_id]
+        if len(queue) >= self.size:
+            victim = self.find_victim(queue, event)
+            if victim is None:
+                self.drop(event)
+                return False
+            self.drop(victim[0])
+            queue.remove(victim)
+        queue.append((event, args))
+        return True
+
+    def find_victim(self, queue, event):
+        rank = self.shed_events.get(event, len(self.shed_events))
+        victim = None
+        for item in queue:
+            item_rank = self.shed_events.get(item[0])
+            if item_rank is not None and item_rank < rank:
+                victim = item
+                rank = item_rank
+        return victim
+
+    def drop(self, event):
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        log.debug(f"Dropped queued {event} (server queue full)")
+
+    def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+        for task in self.running:
+            task.cancel()
+        self.running.clear()
+
+    def depths(self):
+        depths = {}
+        for server_id in self.queues:
+            depths[server_id] = len(self.queues[server_id])
+        return depths
+
+    def stats(self):
+        depths = self.depths()
+        return {
+            "pending": sum(depths.values()),
+            "servers": len(depths),
+            "deepest": max(depths.values()) if depths else 0,
+            "depths": depths,
+            "dropped": dict(self.dropped),
+            "running": len(self.running)
+        }
+
+    async def run(self, event, args):
+        try:
+            await self.transportlayerbot.run_standard_handlers(event, *args)
+        except Exception:
+            log.exception(f"Error in queued {event} handlers")
+
+    async def work(self):
+        while True:
+            while not self.ready:
+                self.wake.clear()
+                await self.wake.wait()
+            # A server is only worked on by one worker at a time, then goes to the back of the line
+            server_id = self.ready.popleft()
+            queue = self.queues[server_id]
+            event, args = queue.popleft()
+            task = self.transportlayerbot.loop.create_task(self.run(event, args))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+            try:
+                # Handlers still running after the hold time (e.g. waiting on a user) carry on
+                # without the worker, so they can't starve every other server
+                done, pending = await asyncio.wait([task], timeout=self.hold)
+                if pending:
+                    log.debug(f"Queued {event} handlers still running after {self.hold}s, releasing worker")
+            finally:
+                if queue:
+                    self.ready.append(server_id)
+                    self.wake.set()
+                else:
+                    del(self.queues[server_id])